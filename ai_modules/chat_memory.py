@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Server-side chatbot conversations with a bounded prompt.
+# Each session keeps a running summary plus the most recent turns. When summary + recent
+# turns exceed the token budget, the oldest turns are folded into the summary, so the
+# context sent with every question stays under the budget however long the chat runs.
+
+load_dotenv()
+
+# Tokens of conversation context (summary + recent turns) sent with each question
+CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))
+# Upper bound on the running summary
+SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "300"))
+SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "7200"))
+MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))
+
+
+# Rough token count (~4 characters per token for English text); avoids an API call per turn
+def estimate_tokens(text):
+    return (len(text or "") + 3) // 4
+
+
+class ChatSession:
+    def __init__(self, session_id, owner):
+        self.id = session_id
+        self.owner = owner
+        self.summary = ""
+        self.turns = []  # [(question, answer)], oldest first
+        self.lock = threading.Lock()
+        self.updated_at = time.time()
+
+    def context_tokens(self):
+        return estimate_tokens(self.summary) + sum(estimate_tokens(q) + estimate_tokens(a) for q, a in self.turns)
+
+
+class ConversationMemory:
+    # summarize(previous_summary, turns, max_tokens) -> new summary text
+    def __init__(self, summarize, context_tokens=CONTEXT_TOKENS, summary_tokens=SUMMARY_TOKENS,
+                 ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.summarize = summarize
+        self.context_tokens = context_tokens
+        self.summary_tokens = summary_tokens
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._stats = {"created": 0, "expired": 0, "compactions": 0, "fallback_compactions": 0}
+
+    # Return the owner's session, or a new one if the id is unknown, expired or someone else's
+    def get_or_create(self, session_id, owner):
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            if session is not None and (session.owner != owner or now - session.updated_at > self.ttl):
+                session = None
+            if session is None:
+                session = ChatSession(uuid.uuid4().hex, owner)
+                self._sessions[session.id] = session
+                self._stats["created"] += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self._stats["expired"] += 1
+            self._sessions.move_to_end(session.id)
+            return session
+
+    def drop(self, session_id, owner):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and session.owner == owner:
+                del self._sessions[session_id]
+                return True
+        return False
+
+    # Summary and recent turns to send with the next question, compacting first if needed
+    def context(self, session):
+        with session.lock:
+            if session.context_tokens() > self.context_tokens:
+                self._compact(session)
+            return session.summary, list(session.turns)
+
+    def add_turn(self, session, question, answer):
+        with session.lock:
+            session.turns.append((question, answer))
+            session.updated_at = time.time()
+
+    # Fold the oldest turns into the summary until the context is at most half the budget,
+    # so compaction (one extra model call) happens every few turns rather than every turn
+    def _compact(self, session):
+        target = self.context_tokens // 2
+        remaining = session.context_tokens()
+        folded = []
+        while session.turns and remaining > target:
+            question, answer = session.turns.pop(0)
+            remaining -= estimate_tokens(question) + estimate_tokens(answer)
+            folded.append((question, answer))
+        if not folded:
+            return
+        try:
+            summary = self.summarize(session.summary, folded, self.summary_tokens)
+            if not summary or summary.startswith("Error:"):
+                raise ValueError(summary or "empty summary")
+            self._stats["compactions"] += 1
+        except Exception as e:
+            # Keep the prompt bounded even if the model is unavailable: keep a clipped transcript
+            print(f"Chat summary failed, truncating instead: {e}")
+            transcript = " ".join(f"Q: {q} A: {a}" for q, a in folded)
+            summary = f"{session.summary} {transcript}".strip()
+            self._stats["fallback_compactions"] += 1
+        # The summary itself never exceeds its own budget
+        session.summary = summary.strip()[-self.summary_tokens * 4:]
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "sessions": len(self._sessions)}
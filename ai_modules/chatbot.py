@@ -1,4 +1,53 @@
-from ai_modules.gemini_config import generate_response
+from ai_modules.gemini_config import generate_response, generate_response_stream
+from ai_modules.chat_memory import ConversationMemory
 
-def ask_chatbot(user_query):
-    return generate_response(f"Answer this query as a helpful assistant: {user_query}")
+# Generation parameters for chatbot answers
+CHATBOT_TEMPERATURE = 0.7
+SUMMARY_TEMPERATURE = 0.2
+
+def _chatbot_prompt(user_query, summary='', turns=()):
+    if not summary and not turns:
+        return f"Answer this query as a helpful assistant: {user_query}"
+    parts = ["You are a helpful assistant continuing a conversation with a student."]
+    if summary:
+        parts.append(f"Summary of the earlier conversation:\n{summary}")
+    if turns:
+        parts.append("Recent messages:\n" + "\n".join(f"Student: {q}\nAssistant: {a}" for q, a in turns))
+    parts.append(f"Answer the student's new message: {user_query}")
+    return "\n\n".join(parts)
+
+# Fold older exchanges into the running summary (used by the conversation memory)
+def _summarize_turns(previous_summary, turns, max_tokens):
+    transcript = "\n".join(f"Student: {q}\nAssistant: {a}" for q, a in turns)
+    prompt = (
+        "Update the running summary of a tutoring conversation. Keep facts, definitions, the student's "
+        "goals and anything they may refer back to; drop pleasantries. Return only the summary.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+    )
+    return generate_response(prompt, use_cache=False, temperature=SUMMARY_TEMPERATURE, max_output_tokens=max_tokens)
+
+chat_memory = ConversationMemory(_summarize_turns)
+
+# chat_session is an optional chat_memory session; its context is included and the new turn recorded
+def ask_chatbot(user_query, chat_session=None):
+    if chat_session is None:
+        return generate_response(_chatbot_prompt(user_query), temperature=CHATBOT_TEMPERATURE)
+    summary, turns = chat_memory.context(chat_session)
+    answer = generate_response(_chatbot_prompt(user_query, summary, turns), temperature=CHATBOT_TEMPERATURE)
+    if answer and not answer.startswith("Error:"):
+        chat_memory.add_turn(chat_session, user_query, answer)
+    return answer
+
+# Generator variant: yields the answer in chunks as it is generated
+def ask_chatbot_stream(user_query, chat_session=None):
+    if chat_session is None:
+        yield from generate_response_stream(_chatbot_prompt(user_query), temperature=CHATBOT_TEMPERATURE)
+        return
+    summary, turns = chat_memory.context(chat_session)
+    parts = []
+    for chunk in generate_response_stream(_chatbot_prompt(user_query, summary, turns), temperature=CHATBOT_TEMPERATURE):
+        parts.append(chunk)
+        yield chunk
+    answer = "".join(parts)
+    if answer and not answer.startswith("Error:"):
+        chat_memory.add_turn(chat_session, user_query, answer)
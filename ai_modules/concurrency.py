@@ -0,0 +1,95 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Process-wide admission control for Gemini calls.
+# At most max_concurrent calls run at once and at most max_waiting callers queue for a slot;
+# anyone beyond that is turned away immediately with a Retry-After hint instead of piling up.
+
+load_dotenv()
+
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+MAX_QUEUE = int(os.getenv("GEMINI_MAX_QUEUE", "32"))
+# Longest a queued caller waits for a slot before giving up (seconds)
+QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "30"))
+
+
+class GeminiOverloaded(Exception):
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class ConcurrencyLimiter:
+    def __init__(self, max_concurrent=MAX_CONCURRENCY, max_waiting=MAX_QUEUE, timeout=QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._avg_call = 1.0  # moving average of call duration, for Retry-After estimates
+        self._stats = {"admitted": 0, "rejected": 0, "timed_out": 0, "upstream_retries": 0,
+                       "upstream_rate_limited": 0, "wait_total": 0.0, "wait_max": 0.0}
+
+    def _retry_after(self):
+        # Time for the queue ahead to drain at the current call rate
+        return self._avg_call * (self._waiting + 1) / max(self.max_concurrent, 1)
+
+    # Hold a slot for the duration of the block; raises GeminiOverloaded if none is available
+    @contextmanager
+    def slot(self):
+        started = time.monotonic()
+        with self._cond:
+            if self._in_flight >= self.max_concurrent:
+                if self._waiting >= self.max_waiting:
+                    self._stats["rejected"] += 1
+                    raise GeminiOverloaded("AI service is busy", self._retry_after())
+                self._waiting += 1
+                try:
+                    deadline = started + self.timeout
+                    while self._in_flight >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats["timed_out"] += 1
+                            raise GeminiOverloaded("Timed out waiting for the AI service", self._retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_flight += 1
+            waited = time.monotonic() - started
+            self._stats["admitted"] += 1
+            self._stats["wait_total"] += waited
+            self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+
+        call_started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._avg_call = 0.8 * self._avg_call + 0.2 * (time.monotonic() - call_started)
+                self._cond.notify()
+
+    def record(self, key, n=1):
+        with self._cond:
+            self._stats[key] += n
+
+    def stats(self):
+        with self._cond:
+            admitted = self._stats["admitted"]
+            return {
+                **self._stats,
+                "in_flight": self._in_flight,
+                "queue_depth": self._waiting,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_waiting,
+                "wait_avg": self._stats["wait_total"] / admitted if admitted else 0.0,
+                "call_avg": self._avg_call,
+            }
+
+
+gemini_limiter = ConcurrencyLimiter()
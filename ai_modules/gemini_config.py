@@ -1,49 +1,246 @@
+import json
 import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 import google.generativeai as genai
 
+from ai_modules.response_cache import response_cache, cache_key, CACHE_ENABLED
+from ai_modules.concurrency import gemini_limiter, GeminiOverloaded
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    RATE_LIMIT_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests,
+                         google_exceptions.ServiceUnavailable)
+except ImportError:
+    RATE_LIMIT_ERRORS = ()
+
 # Load environment variables from .env file
 load_dotenv()
 
 # Get the API key from the environment
 API_KEY = os.getenv("GEMINI_API_KEY")
 
-# Configure the generative AI client
-genai.configure(api_key=API_KEY)
+DEFAULT_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+
+# Retries on upstream rate-limit errors, with exponential backoff and full jitter (seconds)
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "8"))
+
+# Shared GenerativeModel instances keyed by (model name, generation config).
+# The SDK is configured once, on first use, and the instances (and their
+# underlying API client) are reused across requests.
+_models = {}
+_models_lock = threading.Lock()
+_configured = False
+
+def _ensure_configured():
+    global _configured
+    if not _configured:
+        # Configure the generative AI client
+        genai.configure(api_key=API_KEY)
+        _configured = True
+
+# Build a generation config from per-call parameters (None means the model default)
+def generation_config(temperature=None, max_output_tokens=None):
+    config = {}
+    if temperature is not None:
+        config["temperature"] = float(temperature)
+    if max_output_tokens is not None:
+        config["max_output_tokens"] = int(max_output_tokens)
+    return config
+
+# Return the shared model instance for this model name and generation config
+def get_model(model=DEFAULT_MODEL, config=None):
+    key = (model, tuple(sorted((config or {}).items())))
+    with _models_lock:
+        instance = _models.get(key)
+        if instance is None:
+            _ensure_configured()
+            instance = genai.GenerativeModel(model, generation_config=config or None)
+            _models[key] = instance
+    return instance
+
+def _is_rate_limited(error):
+    if RATE_LIMIT_ERRORS and isinstance(error, RATE_LIMIT_ERRORS):
+        return True
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or "quota" in text.lower()
+
+# Call Gemini, backing off and retrying while it reports rate limits.
+# Raises GeminiOverloaded when retries run out; other errors propagate.
+def _retry_rate_limits(call):
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return call()
+        except Exception as e:
+            if not _is_rate_limited(e):
+                raise
+            gemini_limiter.record("upstream_rate_limited")
+            if attempt == MAX_RETRIES:
+                raise GeminiOverloaded("AI service rate limit reached", BACKOFF_MAX)
+            gemini_limiter.record("upstream_retries")
+            time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))))
 
 # Define a helper function to generate responses
-def generate_response(prompt, model="gemini-1.5-flash"):
+def _generate_uncached(prompt, model, config):
     try:
-        model = genai.GenerativeModel(model)
-        response = model.generate_content(prompt)
+        with gemini_limiter.slot():
+            response = _retry_rate_limits(lambda: get_model(model, config).generate_content(prompt))
         return response.text
+    except GeminiOverloaded:
+        raise
     except Exception as e:
         return f"Error: {e}"
 
-# Generate study plan title
-def generate_title(study_request):
+# Identical (model, config, prompt) requests are served from the response cache;
+# concurrent identical calls share a single upstream request.
+# should_cache(text) can further restrict what is cached (e.g. only output that parses).
+def generate_response(prompt, model=DEFAULT_MODEL, use_cache=True, temperature=None, max_output_tokens=None,
+                      should_cache=None):
+    config = generation_config(temperature, max_output_tokens)
+    if not use_cache or not CACHE_ENABLED:
+        return _generate_uncached(prompt, model, config)
+    return response_cache.get_or_compute(
+        cache_key(model, prompt, config),
+        lambda: _generate_uncached(prompt, model, config),
+        should_cache=lambda text: bool(text) and not text.startswith("Error:")
+                                  and (should_cache is None or should_cache(text))
+    )
+
+# Stream a response as text chunks; the full text is cached once the stream completes
+def generate_response_stream(prompt, model=DEFAULT_MODEL, use_cache=True, temperature=None, max_output_tokens=None):
+    config = generation_config(temperature, max_output_tokens)
+    use_cache = use_cache and CACHE_ENABLED
+    key = cache_key(model, prompt, config)
+    if use_cache:
+        cached = response_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    parts = []
     try:
-        prompt = f"Generate a concise, descriptive title for this study plan request: {study_request}. Return only the title, no additional text."
-        title = generate_response(prompt)
-        return title.strip() if title and not title.startswith("Error:") else "Study Plan"
+        # The slot is held until the stream is fully consumed; rate limits are retried
+        # only while opening the stream, before any text has been sent
+        with gemini_limiter.slot():
+            response = _retry_rate_limits(
+                lambda: get_model(model, config).generate_content(prompt, stream=True)
+            )
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunk without text parts (e.g. safety metadata only)
+                    continue
+                if text:
+                    parts.append(text)
+                    yield text
+    except GeminiOverloaded:
+        raise
     except Exception as e:
-        return "Study Plan"
+        yield f"Error: {e}"
+        return
+
+    if use_cache and parts:
+        response_cache.set(key, "".join(parts))
+
+# Parse JSON from model output, tolerating code fences and prose around the document.
+# Raises ValueError if no JSON object or array can be found.
+def extract_json(raw):
+    text = (raw or "").strip()
+    candidates = [m.group(1) for m in re.finditer(r"```(?:json|JSON)?\s*(.*?)```", text, re.S)] + [text]
+    decoder = json.JSONDecoder()
+    for candidate in candidates:
+        candidate = candidate.strip()
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            pass
+        # Otherwise take the first complete object/array, ignoring text before and after it
+        for match in re.finditer(r"[{\[]", candidate):
+            try:
+                return decoder.raw_decode(candidate, match.start())[0]
+            except ValueError:
+                continue
+    raise ValueError("No JSON found in model output")
+
+PLAN_SCHEMA = (
+    '{"title": "concise plan title", "tasks": [{"task": "what to study", '
+    '"due_date": "YYYY-MM-DDT17:00:00Z", "status": "pending"}]}'
+)
 
-# Generate study tasks in strict JSON format
-def generate_tasks_json(study_request, num_tasks=5):
+# Check a generated plan against PLAN_SCHEMA; returns (plan, problems).
+# Invalid tasks are dropped and described in problems (used for the repair prompt).
+def validate_study_plan(data, num_tasks):
+    if isinstance(data, list):
+        data = {"tasks": data}
+    if not isinstance(data, dict):
+        return None, ["the output is not a JSON object"]
+    problems = []
+    title = data.get("title")
+    title = title.strip()[:120] if isinstance(title, str) and title.strip() else None
+    tasks = data.get("tasks")
+    if not isinstance(tasks, list):
+        return None, ["'tasks' must be an array of task objects"]
+    valid = []
+    for index, task in enumerate(tasks[:num_tasks]):
+        if not isinstance(task, dict) or not str(task.get("task") or "").strip():
+            problems.append(f"tasks[{index}] needs a non-empty 'task' string")
+            continue
+        due_date = task.get("due_date")
+        try:
+            datetime.strptime(str(due_date).strip()[:10], "%Y-%m-%d")
+        except ValueError:
+            problems.append(f"tasks[{index}].due_date {due_date!r} is not an ISO 8601 date")
+            continue
+        valid.append({"task": str(task["task"]).strip(), "due_date": str(due_date).strip(),
+                      "status": task.get("status") if task.get("status") in ("pending", "completed") else "pending"})
+    if not valid:
+        problems.append("no valid tasks")
+        return None, problems
+    return {"title": title, "tasks": valid}, problems
+
+def _parse_study_plan(raw, num_tasks):
     try:
-        system_prompt = (
-            "You are an assistant that outputs ONLY valid JSON with no code fences. "
-            "Return an array named tasks of task objects. Each task must have: "
-            "task (string), due_date (ISO 8601 string, e.g., 2025-01-31T17:00:00Z), status (string: 'pending'). "
-            "Example: {\"tasks\":[{\"task\":\"Revise chapter 1\",\"due_date\":\"2025-01-01T17:00:00Z\",\"status\":\"pending\"}]}"
-        )
-        prompt = (
-            f"{system_prompt}\n\n"
-            f"Create {num_tasks} study tasks for this request: {study_request}. "
-            f"Distribute due_date over the next 7 days."
-        )
-        raw = generate_response(prompt)
-        return raw
-    except Exception as e:
-        return f"Error: {e}"
\ No newline at end of file
+        return validate_study_plan(extract_json(raw), num_tasks)
+    except ValueError:
+        return None, ["the output is not valid JSON"]
+
+# Generate a study plan title and its tasks in one call: {"title": str or None, "tasks": [...]}.
+# Output that cannot be parsed or has no valid task gets one repair call with the problems listed;
+# raises ValueError if that also fails.
+def generate_study_plan(study_request, num_tasks=5):
+    today = datetime.now(timezone.utc).date().isoformat()
+    prompt = (
+        f"Create a study plan for this request: {study_request}\n"
+        f"Give it a concise, descriptive title and {num_tasks} study tasks. "
+        f"Today is {today}; distribute due_date over the next 7 days.\n"
+        f"Return ONLY valid JSON with no code fences or other text, in this shape: {PLAN_SCHEMA}"
+    )
+    # The pinned SDK has no JSON response mode, so the prompt asks for bare JSON and
+    # extract_json tolerates fences or prose around it.
+    # Only output that yields a valid plan is cached, so a retry of the same request
+    # calls the model again instead of replaying unusable output
+    raw = generate_response(prompt, temperature=0.2,
+                            should_cache=lambda text: _parse_study_plan(text, num_tasks)[0] is not None)
+    if not raw or raw.startswith("Error:"):
+        raise ValueError("AI service error, please try again")
+    plan, problems = _parse_study_plan(raw, num_tasks)
+    if plan is not None:
+        return plan
+
+    # Targeted repair: fix the previous output rather than regenerating from scratch
+    repair_prompt = (
+        f"This output was supposed to be JSON in the shape {PLAN_SCHEMA} with {num_tasks} tasks, "
+        f"but {'; '.join(problems)}. Return only the corrected JSON.\n\n{raw}"
+    )
+    repaired = generate_response(repair_prompt, use_cache=False, temperature=0.0)
+    plan, problems = _parse_study_plan(repaired, num_tasks)
+    if plan is None:
+        raise ValueError("Failed to parse AI response")
+    return plan
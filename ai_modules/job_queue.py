@@ -0,0 +1,282 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Background jobs for long-running AI generation.
+# Routes submit a job and return its id immediately; a bounded thread pool runs the
+# registered handler and clients poll for the result, so slow Gemini calls no longer
+# hold a web worker. Finished jobs are kept for a TTL. With AI_JOB_DB set, jobs are
+# also stored in SQLite: results stay readable and unfinished jobs are re-run after a restart.
+# Each unfinished row is leased by the process running it (a random per-process token) and the
+# lease is renewed by a heartbeat; rows whose lease lapsed are claimed atomically by another
+# process, so jobs survive restarts and crashes without two processes running the same job.
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", "4"))
+# Jobs waiting or running at once; submit() refuses more so a burst cannot queue forever
+JOB_MAX_PENDING = int(os.getenv("AI_JOB_MAX_PENDING", "100"))
+JOB_TTL = float(os.getenv("AI_JOB_TTL", "3600"))
+# Path to a SQLite file for job persistence; unset keeps jobs in memory only
+JOB_DB_PATH = os.getenv("AI_JOB_DB", "")
+# Seconds an unfinished persisted job stays claimed without a heartbeat from its process
+JOB_LEASE = float(os.getenv("AI_JOB_LEASE", "60"))
+# Runs per job (first run plus recoveries) before it is marked failed instead of re-run
+JOB_MAX_ATTEMPTS = int(os.getenv("AI_JOB_MAX_ATTEMPTS", "3"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(self, max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, ttl=JOB_TTL, db_path=JOB_DB_PATH,
+                 lease=JOB_LEASE, max_attempts=JOB_MAX_ATTEMPTS):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._handlers = {}
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-job")
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "recovered": 0}
+        # Random per-process token: hostnames and PIDs repeat across container restarts
+        self._worker = uuid.uuid4().hex
+        self._recovery_enabled = False
+        self._db = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, owner TEXT, "
+                    "status TEXT NOT NULL, payload TEXT, result TEXT, error TEXT, "
+                    "created_at REAL NOT NULL, finished_at REAL, worker TEXT, lease_until REAL, "
+                    "attempts INTEGER NOT NULL DEFAULT 0)"
+                )
+                columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+                for column, ddl in (("worker", "worker TEXT"), ("lease_until", "lease_until REAL"),
+                                    ("attempts", "attempts INTEGER NOT NULL DEFAULT 0")):
+                    if column not in columns:
+                        self._db.execute(f"ALTER TABLE jobs ADD COLUMN {ddl}")
+                self._db.commit()
+            except Exception as e:
+                print(f"AI jobs: persistence disabled ({e})")
+                self._db = None
+        if self._db is not None:
+            threading.Thread(target=self._heartbeat, name="ai-job-heartbeat", daemon=True).start()
+
+    # Register the function that runs jobs of this kind: handler(payload) -> JSON-serializable result
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    # Re-run unfinished jobs whose lease lapsed (their process exited), now and then periodically
+    # from the heartbeat. Call once the process is actually serving, after registering handlers;
+    # see app.py.
+    def recover(self):
+        if self._db is None:
+            return 0
+        self._recovery_enabled = True
+        self._purge_disk()
+        return self._recover_expired()
+
+    def _recover_expired(self):
+        now = time.time()
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT id, kind, owner, payload, created_at, attempts, lease_until FROM jobs "
+                "WHERE status IN (?, ?) AND (lease_until IS NULL OR lease_until < ?)",
+                (QUEUED, RUNNING, now)
+            ).fetchall()
+        recovered = 0
+        for job_id, kind, owner, payload, created_at, attempts, lease_until in rows:
+            if attempts >= self.max_attempts:
+                self._abandon(job_id, now, f"Job abandoned after {attempts} attempts")
+                continue
+            if kind not in self._handlers:
+                # Possibly a kind only another version of the app handles; give up after the TTL
+                if now - (lease_until or created_at) > self.ttl:
+                    self._abandon(job_id, now, f"No handler for job kind {kind!r}")
+                continue
+            if not self._claim(job_id, now, attempts + 1):
+                continue
+            job = self._new_job(job_id, kind, owner, json.loads(payload or "null"), created_at)
+            job["attempts"] = attempts + 1
+            with self._lock:
+                self._jobs[job_id] = job
+                self._pending += 1
+                self._stats["recovered"] += 1
+            self._executor.submit(self._run, job)
+            recovered += 1
+        return recovered
+
+    # Queue a job and return its id; raises QueueFull when too many jobs are pending
+    def submit(self, kind, owner, payload):
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind {kind!r}")
+        self._purge_memory()
+        job = self._new_job(uuid.uuid4().hex, kind, owner, payload, time.time())
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise QueueFull()
+            self._pending += 1
+            self._jobs[job["id"]] = job
+            self._stats["submitted"] += 1
+        self._save(job)
+        self._executor.submit(self._run, job)
+        return job["id"]
+
+    # Public view of a job (None if unknown or expired)
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                if self._expired(job):
+                    del self._jobs[job_id]
+                    job = None
+                else:
+                    return self._public(job)
+        job = self._load(job_id)
+        if job is None or self._expired(job):
+            return None
+        return self._public(job)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "pending": self._pending, "tracked": len(self._jobs),
+                    "max_pending": self.max_pending, "persistent": self._db is not None}
+
+    # ---------- internals ----------
+
+    def _new_job(self, job_id, kind, owner, payload, created_at):
+        return {"id": job_id, "kind": kind, "owner": owner, "status": QUEUED, "payload": payload,
+                "result": None, "error": None, "created_at": created_at, "finished_at": None, "attempts": 1}
+
+    def _public(self, job):
+        return {k: job[k] for k in ("id", "kind", "owner", "status", "result", "error", "created_at", "finished_at")}
+
+    def _expired(self, job):
+        return job["finished_at"] is not None and time.time() - job["finished_at"] > self.ttl
+
+    def _run(self, job):
+        job["status"] = RUNNING
+        self._save(job)
+        try:
+            job["result"] = self._handlers[job["kind"]](job["payload"])
+            job["status"] = DONE
+        except Exception as e:
+            print(f"AI job {job['id']} ({job['kind']}) failed: {e}")
+            job["error"] = str(e) or e.__class__.__name__
+            job["status"] = FAILED
+        job["finished_at"] = time.time()
+        with self._lock:
+            self._pending -= 1
+            self._stats["completed" if job["status"] == DONE else "failed"] += 1
+        self._save(job)
+
+    def _purge_memory(self):
+        with self._lock:
+            for job_id in [jid for jid, job in self._jobs.items() if self._expired(job)]:
+                del self._jobs[job_id]
+
+    # ---------- persistence ----------
+
+    # Renew this process's leases, and pick up jobs whose process stopped renewing theirs
+    def _heartbeat(self):
+        while True:
+            time.sleep(max(self.lease / 3, 1))
+            try:
+                with self._db_lock:
+                    self._db.execute(
+                        "UPDATE jobs SET lease_until = ? WHERE worker = ? AND status IN (?, ?)",
+                        (time.time() + self.lease, self._worker, QUEUED, RUNNING),
+                    )
+                    self._db.commit()
+                if self._recovery_enabled:
+                    self._recover_expired()
+            except Exception as e:
+                print(f"AI job heartbeat error: {e}")
+
+    # Take over a row atomically: only one process can move a lapsed lease forward
+    def _claim(self, job_id, now, attempts):
+        try:
+            with self._db_lock:
+                claimed = self._db.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = ? "
+                    "WHERE id = ? AND status IN (?, ?) AND (lease_until IS NULL OR lease_until < ?)",
+                    (RUNNING, self._worker, now + self.lease, attempts, job_id, QUEUED, RUNNING, now),
+                ).rowcount == 1
+                self._db.commit()
+            return claimed
+        except Exception as e:
+            print(f"AI job claim error: {e}")
+            return False
+
+    # Mark a lapsed job failed so clients stop waiting and the row expires normally
+    def _abandon(self, job_id, now, error):
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_until = NULL "
+                    "WHERE id = ? AND status IN (?, ?) AND (lease_until IS NULL OR lease_until < ?)",
+                    (FAILED, error, now, job_id, QUEUED, RUNNING, now),
+                )
+                self._db.commit()
+        except Exception as e:
+            print(f"AI job write error: {e}")
+
+    def _save(self, job):
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO jobs (id, kind, owner, status, payload, result, error, created_at, "
+                    "finished_at, worker, lease_until, attempts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job["id"], job["kind"], job["owner"], job["status"], json.dumps(job["payload"]),
+                     json.dumps(job["result"]), job["error"], job["created_at"], job["finished_at"], self._worker,
+                     None if job["finished_at"] is not None else time.time() + self.lease, job["attempts"]),
+                )
+                self._db.commit()
+        except Exception as e:
+            print(f"AI job write error: {e}")
+
+    def _load(self, job_id):
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT id, kind, owner, status, result, error, created_at, finished_at FROM jobs WHERE id = ?",
+                    (job_id,),
+                ).fetchone()
+        except Exception as e:
+            print(f"AI job read error: {e}")
+            return None
+        if row is None:
+            return None
+        return {"id": row[0], "kind": row[1], "owner": row[2], "status": row[3],
+                "result": json.loads(row[4]) if row[4] else None, "error": row[5],
+                "created_at": row[6], "finished_at": row[7], "payload": None}
+
+    def _purge_disk(self):
+        try:
+            with self._db_lock:
+                self._db.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                                 (time.time() - self.ttl,))
+                self._db.commit()
+        except Exception as e:
+            print(f"AI job purge error: {e}")
+
+
+job_queue = JobQueue()
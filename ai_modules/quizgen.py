@@ -1,12 +1,191 @@
-from ai_modules.gemini_config import generate_response
+import hashlib
+import json
+import os
+import threading
+from dotenv import load_dotenv
 
-def generate_quiz(content, num_questions=5):
+from ai_modules.gemini_config import generate_response, generate_response_stream, extract_json
+from ai_modules.response_cache import response_cache, normalize_prompt, CACHE_ENABLED
+
+load_dotenv()
+
+# Generation parameters for quizzes
+QUIZ_TEMPERATURE = 0.7
+
+# Structured quizzes are generated several independent sets per call and pooled under the
+# content hash; later requests for the same material take an unseen set from the pool
+QUIZ_SETS_PER_CALL = int(os.getenv("QUIZ_SETS_PER_CALL", "3"))
+# Questions per generation call across all sets, so a batch fits in one response
+QUIZ_MAX_QUESTIONS_PER_CALL = int(os.getenv("QUIZ_MAX_QUESTIONS_PER_CALL", "30"))
+# Sets kept per content hash; the oldest are dropped first
+QUIZ_POOL_MAX_SETS = int(os.getenv("QUIZ_POOL_MAX_SETS", "12"))
+MAX_QUIZ_QUESTIONS = 20
+
+QUESTION_TYPES = {
+    "multiple-choice": "multiple-choice questions with exactly 4 options",
+    "true-false": 'true/false questions whose options are exactly ["True", "False"]',
+    "fill-blank": "fill-in-the-blank questions: the question contains a blank written as ____ and 4 candidate options",
+}
+DIFFICULTIES = ("easy", "medium", "hard")
+
+_pool_lock = threading.Lock()
+
+def _question_count(num_questions):
     try:
         num = int(num_questions) if num_questions else 5
     except Exception:
         num = 5
-    prompt = (
+    return max(1, min(num, MAX_QUIZ_QUESTIONS))
+
+def _quiz_prompt(content, num_questions=5):
+    num = _question_count(num_questions)
+    return (
         f"Create {num} multiple-choice questions (with correct answer labeled) from this content. "
         f"Return plain text with clear numbering and options A-D.\n\n{content}"
     )
-    return generate_response(prompt)
+
+def generate_quiz(content, num_questions=5):
+    return generate_response(_quiz_prompt(content, num_questions), temperature=QUIZ_TEMPERATURE)
+
+# Generator variant: yields the quiz text in chunks as it is generated
+def generate_quiz_stream(content, num_questions=5):
+    return generate_response_stream(_quiz_prompt(content, num_questions), temperature=QUIZ_TEMPERATURE)
+
+# ---------- structured quizzes ----------
+
+def _quiz_options(difficulty, question_type):
+    difficulty = difficulty if difficulty in DIFFICULTIES else "medium"
+    question_type = question_type if question_type in QUESTION_TYPES else "multiple-choice"
+    return difficulty, question_type
+
+def _structured_prompt(content, num_questions, difficulty, question_type, num_sets):
+    return (
+        f"Create {num_sets} independent quiz sets from the content below. Each set has {num_questions} "
+        f"{QUESTION_TYPES[question_type]}, at {difficulty} difficulty. Different sets must ask about "
+        "different facts or ask in different ways; do not repeat questions across sets.\n"
+        'Return ONLY valid JSON with no code fences or other text, in this shape: {"sets": [{"questions": [{"question": "...", '
+        '"options": ["...", "..."], "answer": 0, "explanation": "..."}]}]} '
+        "where answer is the 0-based index of the correct option and explanation is one sentence "
+        "saying why it is correct.\n\n"
+        f"{content}"
+    )
+
+# Validate one question from the model; returns the normalized question or None
+def validate_question(item, question_type="multiple-choice"):
+    if not isinstance(item, dict):
+        return None
+    question = str(item.get("question") or "").strip()
+    options = item.get("options")
+    if not question or not isinstance(options, list):
+        return None
+    options = [str(option).strip() for option in options]
+    if not 2 <= len(options) <= 6 or not all(options) or len(set(options)) != len(options):
+        return None
+    # Hold each type to the shape the prompt asked for, since sets are reused from the pool
+    if question_type == "true-false" and options != ["True", "False"]:
+        return None
+    if question_type in ("multiple-choice", "fill-blank") and len(options) != 4:
+        return None
+    if question_type == "fill-blank" and "____" not in question:
+        return None
+    answer = item.get("answer")
+    # Tolerate a letter ("B") or the option text in place of the index
+    if isinstance(answer, str):
+        answer = answer.strip()
+        if len(answer) == 1 and answer.upper() in "ABCDEF":
+            answer = "ABCDEF".index(answer.upper())
+        elif answer in options:
+            answer = options.index(answer)
+        elif answer.isdigit():
+            answer = int(answer)
+    if isinstance(answer, bool) or not isinstance(answer, int) or not 0 <= answer < len(options):
+        return None
+    return {
+        "question": question,
+        "options": options,
+        "answer": answer,
+        "explanation": str(item.get("explanation") or "").strip(),
+    }
+
+# Validate a quiz set; returns {"id", "questions"} or None if it has too few usable questions
+def validate_quiz_set(item, num_questions, question_type="multiple-choice"):
+    questions = item.get("questions") if isinstance(item, dict) else item
+    if not isinstance(questions, list):
+        return None
+    valid = [q for q in (validate_question(q, question_type) for q in questions) if q is not None]
+    if len(valid) < num_questions:
+        return None
+    valid = valid[:num_questions]
+    set_id = hashlib.sha1(json.dumps(valid, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return {"id": set_id, "questions": valid}
+
+# Generate num_sets quiz sets in one call; raises ValueError if none are usable
+def generate_quiz_sets(content, num_questions=5, difficulty=None, question_type=None, num_sets=QUIZ_SETS_PER_CALL):
+    num_questions = _question_count(num_questions)
+    difficulty, question_type = _quiz_options(difficulty, question_type)
+    num_sets = max(1, min(num_sets, QUIZ_MAX_QUESTIONS_PER_CALL // num_questions))
+    # Uncached: the pool is the cache, and a repeat call must produce new sets
+    raw = generate_response(_structured_prompt(content, num_questions, difficulty, question_type, num_sets),
+                            use_cache=False, temperature=QUIZ_TEMPERATURE)
+    if not raw or raw.startswith("Error:"):
+        raise ValueError(raw or "Error: empty response")
+    try:
+        data = extract_json(raw)
+    except ValueError:
+        raise ValueError("Error: the AI returned an invalid quiz, please try again")
+    items = data.get("sets") if isinstance(data, dict) else data
+    if isinstance(data, dict) and items is None and "questions" in data:
+        items = [data]
+    sets, ids = [], set()
+    for item in items if isinstance(items, list) else []:
+        quiz_set = validate_quiz_set(item, num_questions, question_type)
+        if quiz_set is not None and quiz_set["id"] not in ids:
+            ids.add(quiz_set["id"])
+            sets.append(quiz_set)
+    if not sets:
+        raise ValueError("Error: the AI returned an invalid quiz, please try again")
+    return sets
+
+# Pool key: same (normalized) content and quiz settings share a pool
+def quiz_pool_key(content, num_questions=5, difficulty=None, question_type=None):
+    difficulty, question_type = _quiz_options(difficulty, question_type)
+    payload = f"{_question_count(num_questions)}\0{difficulty}\0{question_type}\0{normalize_prompt(content)}"
+    return "quizpool:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _pool_sets(key):
+    raw = response_cache.get(key)
+    try:
+        return json.loads(raw) if raw else []
+    except ValueError:
+        return []
+
+# A pooled set not in seen (set ids the client has already shown), or None
+def next_pooled_quiz(content, num_questions=5, difficulty=None, question_type=None, seen=()):
+    if not CACHE_ENABLED:
+        return None
+    seen = set(seen or ())
+    for quiz_set in _pool_sets(quiz_pool_key(content, num_questions, difficulty, question_type)):
+        if quiz_set["id"] not in seen:
+            return quiz_set
+    return None
+
+def _add_to_pool(key, sets):
+    if not CACHE_ENABLED:
+        return
+    with _pool_lock:
+        pooled = _pool_sets(key)
+        known = {s["id"] for s in pooled}
+        pooled.extend(s for s in sets if s["id"] not in known)
+        response_cache.set(key, json.dumps(pooled[-QUIZ_POOL_MAX_SETS:]))
+
+# Structured quiz for this content: an unseen pooled set if there is one, otherwise a new
+# batch is generated and pooled. Returns (quiz_set, from_pool); raises ValueError on failure.
+def generate_structured_quiz(content, num_questions=5, difficulty=None, question_type=None, seen=()):
+    pooled = next_pooled_quiz(content, num_questions, difficulty, question_type, seen)
+    if pooled is not None:
+        return pooled, True
+    sets = generate_quiz_sets(content, num_questions, difficulty, question_type)
+    _add_to_pool(quiz_pool_key(content, num_questions, difficulty, question_type), sets)
+    seen = set(seen or ())
+    fresh = [s for s in sets if s["id"] not in seen]
+    return (fresh or sets)[0], False
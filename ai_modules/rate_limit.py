@@ -0,0 +1,152 @@
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from dotenv import load_dotenv
+
+# Per-identity sliding-window rate limits for the AI endpoints.
+# Each tool has a budget of N requests per window; every request is logged with its time
+# and only requests inside the trailing window count, so there are no fixed-window bursts.
+# Hits are kept in process memory by default; set RATE_LIMIT_REDIS_URL to share them
+# between workers (requires the redis package).
+
+load_dotenv()
+
+# Default budgets as requests/seconds; override with AI_RATE_LIMITS="chatbot=30/60,quizgen=5/60"
+DEFAULT_BUDGETS = {
+    "chatbot": (30, 60),
+    "summarize": (10, 60),
+    "quizgen": (10, 60),
+    "study_tasks": (5, 60),
+    "legacy": (10, 60),
+}
+RATE_LIMITS = os.getenv("AI_RATE_LIMITS", "")
+REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")
+
+
+def parse_budgets(spec, defaults=DEFAULT_BUDGETS):
+    budgets = dict(defaults)
+    for item in (spec or "").split(","):
+        name, _, budget = item.partition("=")
+        count, _, window = budget.partition("/")
+        try:
+            budgets[name.strip()] = (int(count), float(window or 60))
+        except ValueError:
+            if item.strip():
+                print(f"Ignoring invalid rate limit {item.strip()!r}")
+    return budgets
+
+
+class RateLimitResult:
+    def __init__(self, allowed, limit, remaining, reset_after):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        # Seconds until the oldest counted request leaves the window
+        self.reset_after = max(0, int(math.ceil(reset_after)))
+
+    def headers(self):
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset_after),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, self.reset_after))
+        return headers
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = {}     # key -> deque of hit times
+        self._windows = {}  # key -> window of the tool the key belongs to
+        self._last_sweep = 0.0
+
+    # Record a hit if it fits in the window; returns (allowed, count_in_window, oldest_hit_time)
+    def hit(self, key, limit, window, now):
+        with self._lock:
+            self._sweep(now, window)
+            hits = self._hits.setdefault(key, deque())
+            self._windows[key] = window
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            allowed = len(hits) < limit
+            if allowed:
+                hits.append(now)
+            return allowed, len(hits), hits[0] if hits else now
+
+    # Drop identities with no recent hits so memory tracks active users only.
+    # Each key is judged by its own tool's window, so a short-window tool sweeping
+    # cannot reset the log of a tool with a longer window.
+    def _sweep(self, now, window):
+        if now - self._last_sweep < window:
+            return
+        self._last_sweep = now
+        for key in [k for k, hits in self._hits.items() if not hits or hits[-1] <= now - self._windows[k]]:
+            del self._hits[key]
+            del self._windows[key]
+
+
+class RedisBackend:
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    # Add first, then count, in one MULTI; a hit that overshoots the limit is taken back
+    def hit(self, key, limit, window, now):
+        redis_key = f"ratelimit:{key}"
+        member = f"{now}:{uuid.uuid4().hex}"
+        pipe = self._redis.pipeline()
+        pipe.zremrangebyscore(redis_key, 0, now - window)
+        pipe.zadd(redis_key, {member: now})
+        pipe.zcard(redis_key)
+        pipe.zrange(redis_key, 0, 0, withscores=True)
+        pipe.expire(redis_key, int(math.ceil(window)))
+        _, _, count, oldest, _ = pipe.execute()
+        allowed = count <= limit
+        if not allowed:
+            self._redis.zrem(redis_key, member)
+            count -= 1
+        return allowed, count, oldest[0][1] if oldest else now
+
+
+class SlidingWindowLimiter:
+    def __init__(self, budgets=None, backend=None):
+        self.budgets = budgets or parse_budgets(RATE_LIMITS)
+        self.backend = backend or MemoryBackend()
+        self._stats_lock = threading.Lock()
+        self._stats = {"allowed": 0, "limited": 0, "backend_errors": 0}
+
+    def check(self, tool, identity):
+        limit, window = self.budgets.get(tool, self.budgets.get("default", (60, 60)))
+        now = time.time()
+        try:
+            allowed, count, oldest = self.backend.hit(f"{tool}:{identity}", limit, window, now)
+        except Exception as e:
+            # Fail open: a broken shared store should not take the AI tools down
+            print(f"Rate limit backend error: {e}")
+            with self._stats_lock:
+                self._stats["backend_errors"] += 1
+            return RateLimitResult(True, limit, limit, window)
+        with self._stats_lock:
+            self._stats["allowed" if allowed else "limited"] += 1
+        return RateLimitResult(allowed, limit, max(limit - count, 0), oldest + window - now)
+
+    def stats(self):
+        with self._stats_lock:
+            return {**self._stats, "backend": type(self.backend).__name__}
+
+
+def _default_backend():
+    if REDIS_URL:
+        try:
+            return RedisBackend(REDIS_URL)
+        except Exception as e:
+            print(f"Rate limits: shared backend unavailable, using process memory ({e})")
+    return MemoryBackend()
+
+
+ai_rate_limiter = SlidingWindowLimiter(backend=_default_backend())
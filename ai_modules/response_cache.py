@@ -0,0 +1,210 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Content-addressed cache for Gemini responses.
+# Keys are a hash of (model, generation config, normalized prompt); entries live in an in-memory
+# LRU bounded by TTL and total size, with an optional SQLite tier that survives restarts.
+# Concurrent identical requests are coalesced so only one upstream call is made.
+
+load_dotenv()
+
+CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", "86400"))
+CACHE_MAX_BYTES = int(os.getenv("GEMINI_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Path to a SQLite file for the persistent tier; unset keeps the cache in memory only
+CACHE_DB_PATH = os.getenv("GEMINI_CACHE_DB", "")
+# Set GEMINI_CACHE_ENABLED=0 to bypass the cache entirely
+CACHE_ENABLED = os.getenv("GEMINI_CACHE_ENABLED", "1") != "0"
+
+
+# Normalize whitespace so trivially different pastes of the same notes share an entry
+def normalize_prompt(prompt):
+    text = unicodedata.normalize("NFC", prompt or "")
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = re.sub(r"[ \t]+", " ", text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+# config is the generation config dict, so differently tuned calls never share an entry
+def cache_key(model, prompt, config=None):
+    config_part = ",".join(f"{k}={v}" for k, v in sorted((config or {}).items()))
+    payload = f"{model}\0{config_part}\0{normalize_prompt(prompt)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResponseCache:
+    def __init__(self, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES, db_path=CACHE_DB_PATH):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._bytes = 0
+        self._flights = {}
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+        self._db = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+                self._db.commit()
+            except Exception as e:
+                print(f"Gemini cache: persistent tier disabled ({e})")
+                self._db = None
+
+    # ---------- memory tier ----------
+
+    def _get_memory(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _put_memory(self, key, value, expires_at):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, value, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    # ---------- persistent tier ----------
+
+    def _get_disk(self, key):
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+        except Exception as e:
+            print(f"Gemini cache read error: {e}")
+            return None
+        if row is None or row[1] <= time.time():
+            return None
+        return row
+
+    def _put_disk(self, key, value, expires_at):
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+                self._db.commit()
+        except Exception as e:
+            print(f"Gemini cache write error: {e}")
+
+    # ---------- public API ----------
+
+    def get(self, key):
+        with self._lock:
+            value = self._get_memory(key)
+            if value is not None:
+                self._stats["hits"] += 1
+                return value
+        row = self._get_disk(key)
+        if row is not None:
+            with self._lock:
+                self._put_memory(key, row[0], row[1])
+                self._stats["disk_hits"] += 1
+            return row[0]
+        return None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._put_memory(key, value, expires_at)
+        self._put_disk(key, value, expires_at)
+
+    # Return the cached value for key, or call compute() once for all concurrent callers.
+    # should_cache(value) decides whether a computed value is stored (e.g. skip errors).
+    def get_or_compute(self, key, compute, should_cache=None):
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            # A flight may have finished between the lookup above and taking the lock
+            value = self._get_memory(key)
+            if value is not None:
+                self._stats["hits"] += 1
+                return value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self._stats["misses"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            value = compute()
+            flight.result = value
+            if value is not None and (should_cache is None or should_cache(value)):
+                self.set(key, value)
+            return value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "in_flight": len(self._flights),
+                "persistent": self._db is not None,
+            }
+
+
+response_cache = ResponseCache()
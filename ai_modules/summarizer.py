@@ -1,6 +1,159 @@
-from ai_modules.gemini_config import generate_response
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from ai_modules.gemini_config import generate_response, generate_response_stream
+from ai_modules.chat_memory import estimate_tokens
+
+load_dotenv()
+
+# Generation parameters for summaries (low temperature keeps them faithful to the notes)
+SUMMARY_TEMPERATURE = 0.3
+
+# Notes longer than this (estimated tokens) are summarized map-reduce style: split into
+# chunks, each chunk summarized in parallel, then the partial summaries merged
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+# Chunk summaries requested at once per call (Gemini calls are also bounded process-wide)
+SUMMARY_MAX_WORKERS = int(os.getenv("SUMMARY_MAX_WORKERS", "4"))
+# Merge rounds before the partial summaries are merged regardless of size
+SUMMARY_MAX_REDUCE_ROUNDS = 3
+
+_HEADING = re.compile(r"^(#{1,6}\s|[A-Z0-9][A-Z0-9 .,:&/()-]{2,80}:?$|(\d+\.)+\s|[A-Z][^.!?]{0,80}:$)", re.M)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+def _summary_prompt(notes_text):
+    return f"Create:\n\n{notes_text}"
+
+# The chunk text is the only variable part of the prompt, so a chunk summary is cached
+# under the hash of its text: re-submitted notes only re-run the chunks that changed
+def _chunk_prompt(chunk):
+    return (
+        "Summarize this section of a student's lecture notes in clear, concise bullet points. "
+        "Keep definitions, formulas, names and numbers; do not add information that is not in the text.\n\n"
+        f"{chunk}"
+    )
+
+def _merge_prompt(partials):
+    sections = "\n\n".join(partials)
+    return (
+        "These are bullet-point summaries of consecutive sections of the same lecture notes. "
+        "Merge them into one well-organized summary in clear, concise bullet points, grouped under short headings. "
+        "Remove repetition and keep the original order of topics.\n\n"
+        f"{sections}"
+    )
+
+# Break one oversized paragraph at sentence ends, then hard-wrap anything still too long
+def _split_block(block, max_tokens):
+    max_chars = max_tokens * 4
+    pieces, current = [], ""
+    for sentence in _SENTENCE_END.split(block):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and estimate_tokens(current) + estimate_tokens(sentence) > max_tokens:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        pieces.append(current)
+    return pieces
+
+# Relative chance that a heading block starts a new chunk, versus an ordinary paragraph
+HEADING_BOUNDARY_WEIGHT = 4
+
+# Whether a new chunk starts at this block. The decision depends only on the block's own
+# text (a hash compared against its share of the target chunk size), never on what comes
+# before it, so inserting or editing a paragraph moves at most the boundaries around it
+# and every other chunk keeps its text, and therefore its cached summary.
+def _is_boundary(block, target_tokens):
+    weight = HEADING_BOUNDARY_WEIGHT if _HEADING.match(block) else 1
+    probability = min(1.0, weight * estimate_tokens(block) / max(target_tokens, 1))
+    digest = hashlib.sha1(" ".join(block.split()).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64 < probability
+
+# Pack blocks into chunks of at most max_tokens, in order (used within one section)
+def _pack(blocks, max_tokens):
+    chunks, current, current_tokens = [], [], 0
+    for block in blocks:
+        tokens = estimate_tokens(block) + 1
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(block)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+# Split notes into chunks of at most max_tokens on paragraph boundaries.
+# Sections start at content-chosen anchor paragraphs (headings are favoured) and average
+# about half of max_tokens; a section that is still too large is packed within itself only.
+def split_notes(notes_text, max_tokens=SUMMARY_CHUNK_TOKENS):
+    text = (notes_text or "").replace("\r\n", "\n").replace("\r", "\n")
+    blocks = []
+    for block in (b.strip() for b in re.split(r"\n\s*\n", text)):
+        if block:
+            blocks.extend([block] if estimate_tokens(block) <= max_tokens else _split_block(block, max_tokens))
+    sections = []
+    for block in blocks:
+        if not sections or _is_boundary(block, max_tokens // 2):
+            sections.append([])
+        sections[-1].append(block)
+    return [chunk for section in sections for chunk in _pack(section, max_tokens)]
+
+# Run prompts in parallel, in order; returns the texts or raises on the first failed call
+def _generate_all(prompts):
+    def run(prompt):
+        return generate_response(prompt, temperature=SUMMARY_TEMPERATURE)
+    if len(prompts) == 1:
+        results = [run(prompts[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(SUMMARY_MAX_WORKERS, len(prompts))) as pool:
+            results = list(pool.map(run, prompts))
+    for text in results:
+        if not text or text.startswith("Error:"):
+            raise ValueError(text or "Error: empty summary")
+    return results
+
+# Map step plus intermediate merges: returns partial summaries small enough for one final merge
+def _partial_summaries(notes_text):
+    partials = _generate_all([_chunk_prompt(chunk) for chunk in split_notes(notes_text)])
+    rounds = 0
+    while estimate_tokens("\n\n".join(partials)) > SUMMARY_CHUNK_TOKENS and rounds < SUMMARY_MAX_REDUCE_ROUNDS:
+        groups = split_notes("\n\n".join(partials))
+        if len(groups) >= len(partials):
+            break
+        partials = _generate_all([_merge_prompt([group]) for group in groups])
+        rounds += 1
+    return partials
+
+def _is_long(notes_text):
+    return estimate_tokens(notes_text) > SUMMARY_CHUNK_TOKENS
 
 def summarize_notes(notes_text):
-    prompt = f"Create:\n\n{notes_text}"
-    return generate_response(prompt)
-# Summarize the following notes in clear, concise bullet points
\ No newline at end of file
+    if not _is_long(notes_text):
+        return generate_response(_summary_prompt(notes_text), temperature=SUMMARY_TEMPERATURE)
+    try:
+        partials = _partial_summaries(notes_text)
+    except ValueError as e:
+        return str(e)
+    return generate_response(_merge_prompt(partials), temperature=SUMMARY_TEMPERATURE)
+
+# Generator variant: yields the summary in chunks as it is generated.
+# For long notes the chunk summaries are produced first and the final merge is streamed.
+def summarize_notes_stream(notes_text):
+    if not _is_long(notes_text):
+        yield from generate_response_stream(_summary_prompt(notes_text), temperature=SUMMARY_TEMPERATURE)
+        return
+    try:
+        partials = _partial_summaries(notes_text)
+    except ValueError as e:
+        yield str(e)
+        return
+    yield from generate_response_stream(_merge_prompt(partials), temperature=SUMMARY_TEMPERATURE)
@@ -1,19 +1,37 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, Response, g, has_request_context, make_response
 from flask_cors import CORS
 import firebase_admin
 from firebase_admin import credentials, firestore, auth as admin_auth
 import uuid
 from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+import base64
 import json
 import os
+import hashlib
+import itertools
+import re
+import threading
+import time
 import requests
 from dotenv import load_dotenv
 
 # AI modules
-from ai_modules.chatbot import ask_chatbot
-from ai_modules.summarizer import summarize_notes
-from ai_modules.quizgen import generate_quiz
-from ai_modules.gemini_config import generate_tasks_json
+from ai_modules.chatbot import ask_chatbot, ask_chatbot_stream, chat_memory
+from ai_modules.summarizer import summarize_notes, summarize_notes_stream
+from ai_modules.quizgen import generate_quiz, generate_quiz_stream, generate_structured_quiz, next_pooled_quiz
+from ai_modules.gemini_config import generate_study_plan
+from ai_modules.response_cache import response_cache
+from ai_modules.job_queue import job_queue, QueueFull
+from ai_modules.concurrency import gemini_limiter, GeminiOverloaded
+from ai_modules.rate_limit import ai_rate_limiter
+
+# Chat event pub/sub (feeds the SSE stream)
+from firebase_utils.message_bus import message_bus
+from firebase_utils.usage_writer import UsageWriter
+from firebase_utils.catalog_cache import CatalogCache
+from firebase_utils.eligibility_index import EligibilityIndex
+from firebase_utils.firestore_utils import normalize_skills, student_search_fields, name_search_key
 
 # Flask app setup
 load_dotenv()
@@ -28,6 +46,10 @@ if not firebase_admin._apps:
     firebase_admin.initialize_app(cred)
 db = firestore.client()
 
+# 🔹 Background writer for ai_usage telemetry
+usage_writer = UsageWriter(db)
+usage_writer.start()
+
 # 🔹 Pyrebase auth (for email/password sign-in)
 try:
     from firebase_utils.firebase_config import auth as pyre_auth
@@ -48,7 +70,8 @@ def inject_firebase_web_config():
     }
     return {
         'FIREBASE_WEB_CONFIG': web_config,
-        'CURRENT_USER_ID': session.get('user_id')
+        'CURRENT_USER_ID': session.get('user_id'),
+        'CURRENT_USER': get_current_user()
     }
 
 # Session configuration
@@ -58,39 +81,114 @@ app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)
 def is_logged_in():
     return 'user_id' in session
 
-# Helper function to get current user
+# Short-lived per-process cache of user profiles (seconds; 0 disables)
+USER_PROFILE_CACHE_TTL = float(os.getenv('USER_PROFILE_CACHE_TTL', '30'))
+_user_profile_cache = {}
+_user_profile_cache_lock = threading.Lock()
+
+# Helper function to load a user profile, through the profile cache
+def load_user_profile(uid):
+    now = time.monotonic()
+    if USER_PROFILE_CACHE_TTL > 0:
+        with _user_profile_cache_lock:
+            cached = _user_profile_cache.get(uid)
+        if cached and cached[0] > now:
+            return dict(cached[1])
+
+    user_doc = db.collection('users').document(uid).get()
+    if not user_doc.exists:
+        return None
+    user_data = user_doc.to_dict()
+    user_data['id'] = user_doc.id  # Keep 'id' for backward compatibility
+
+    if USER_PROFILE_CACHE_TTL > 0:
+        with _user_profile_cache_lock:
+            _user_profile_cache[uid] = (now + USER_PROFILE_CACHE_TTL, user_data)
+    return dict(user_data)
+
+# Drop a cached profile after writing to it
+def invalidate_user_profile(uid):
+    with _user_profile_cache_lock:
+        _user_profile_cache.pop(uid, None)
+    if has_request_context():
+        g.pop('current_user', None)
+
+# Helper function to get current user (loaded once per request into flask.g)
 def get_current_user():
-    if is_logged_in():
-        user_doc = db.collection('users').document(session['user_id']).get()
-        if user_doc.exists:
-            user_data = user_doc.to_dict()
-            user_data['id'] = user_doc.id  # Keep 'id' for backward compatibility
-            return user_data
-    return None
-
-# Helper function to require login
+    if not is_logged_in():
+        return None
+    if 'current_user' not in g:
+        g.current_user = load_user_profile(session['user_id'])
+    return g.current_user
+
+# Decoded ID-token claims, keyed by token hash and valid until the token's exp
+ID_TOKEN_CACHE_SIZE = int(os.getenv('ID_TOKEN_CACHE_SIZE', '1000'))
+# Refresh tokens this many seconds before they expire instead of after they fail
+ID_TOKEN_REFRESH_WINDOW = int(os.getenv('ID_TOKEN_REFRESH_WINDOW', '300'))
+_id_token_cache = OrderedDict()
+_id_token_cache_lock = threading.Lock()
+
+# Helper function to verify an ID token, skipping signature checks for tokens already seen
+def verify_id_token_cached(id_token):
+    key = hashlib.sha256(id_token.encode('utf-8')).hexdigest()
+    with _id_token_cache_lock:
+        claims = _id_token_cache.get(key)
+        if claims is not None:
+            if claims.get('exp', 0) > time.time():
+                _id_token_cache.move_to_end(key)
+                return claims
+            del _id_token_cache[key]
+
+    claims = admin_auth.verify_id_token(id_token)
+    with _id_token_cache_lock:
+        _id_token_cache[key] = claims
+        _id_token_cache.move_to_end(key)
+        while len(_id_token_cache) > ID_TOKEN_CACHE_SIZE:
+            _id_token_cache.popitem(last=False)
+    return claims
+
+# Helper function to exchange the session's refresh token for a new ID token
+def refresh_id_token(refresh_token):
+    refreshed = pyre_auth.refresh(refresh_token)
+    id_token = refreshed.get('idToken') or refreshed.get('id_token')
+    claims = verify_id_token_cached(id_token)
+    session['idToken'] = id_token
+    new_refresh_token = refreshed.get('refreshToken') or refreshed.get('refresh_token')
+    if new_refresh_token:
+        session['refreshToken'] = new_refresh_token
+    return id_token, claims
+
+# Helper function to verify the session's ID token, refreshing it if needed.
+# The decoded claims are kept on flask.g so the token is verified once per request.
 def get_valid_id_token():
+    if 'id_token_claims' in g:
+        return session.get('idToken')
     id_token = session.get('idToken')
     refresh_token = session.get('refreshToken')
     if not refresh_token:
         return None
-    # Verify current token
-    try:
-        if id_token:
-            admin_auth.verify_id_token(id_token)
-            return id_token
-    except Exception:
-        pass
-    # Refresh if needed
-    try:
-        if pyre_auth is not None and refresh_token:
-            refreshed = pyre_auth.refresh(refresh_token)
-            session['idToken'] = refreshed.get('idToken') or refreshed.get('id_token')
-            return session.get('idToken')
-    except Exception:
-        return None
-    return None
+    # Verify current token (a cache lookup in the steady state)
+    claims = None
+    if id_token:
+        try:
+            claims = verify_id_token_cached(id_token)
+        except Exception:
+            claims = None
+    # Refresh when the token is invalid or about to expire
+    if claims is None or claims.get('exp', 0) - time.time() < ID_TOKEN_REFRESH_WINDOW:
+        try:
+            if pyre_auth is None:
+                raise RuntimeError('Pyrebase auth not configured')
+            id_token, claims = refresh_id_token(refresh_token)
+        except Exception as e:
+            if claims is None:
+                return None
+            # Current token is still valid; retry the refresh on a later request
+            print(f"Proactive token refresh failed: {e}")
+    g.id_token_claims = claims
+    return id_token
 
+# Helper function to require login
 def login_required(f):
     def decorated_function(*args, **kwargs):
         if not is_logged_in():
@@ -99,12 +197,7 @@ def login_required(f):
         if not token:
             session.clear()
             return redirect(url_for('login'))
-        try:
-            decoded = admin_auth.verify_id_token(token)
-            request.uid = decoded.get('uid')
-        except Exception:
-            session.clear()
-            return redirect(url_for('login'))
+        request.uid = g.id_token_claims.get('uid')
         return f(*args, **kwargs)
     decorated_function.__name__ = f.__name__
     return decorated_function
@@ -124,6 +217,42 @@ def require_user_type(user_type):
         return decorated_function
     return decorator
 
+# Helper function to apply a tool's per-identity AI rate limit (sliding window).
+# The identity is the signed-in user, or the client IP on the unauthenticated legacy routes.
+def rate_limited(tool):
+    def decorator(f):
+        def decorated_function(*args, **kwargs):
+            user_id = session.get('user_id')
+            identity = f"user:{user_id}" if user_id else f"ip:{request.remote_addr}"
+            result = ai_rate_limiter.check(tool, identity)
+            if result.allowed:
+                response = make_response(f(*args, **kwargs))
+            else:
+                response = jsonify({'error': 'Rate limit exceeded, please try again later',
+                                    'retry_after': max(1, result.reset_after)})
+                response.status_code = 429
+            response.headers.update(result.headers())
+            return response
+        decorated_function.__name__ = f.__name__
+        return decorated_function
+    return decorator
+
+# Helper function to format one Server-Sent Event
+def sse_event(event_type, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return '\n'.join(lines) + '\n\n'
+
+# Gemini is at capacity (limiter queue full or upstream rate limit): ask the client to retry
+@app.errorhandler(GeminiOverloaded)
+def handle_gemini_overloaded(e):
+    response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
 # ==================== AUTHENTICATION ROUTES ====================
 
 @app.route('/')
@@ -167,12 +296,11 @@ def login():
             if not uid:
                 return jsonify({'success': False, 'message': 'Authentication failed'})
 
-            # Verify user profile and type
-            user_doc = db.collection('users').document(uid).get()
-            if not user_doc.exists:
+            # Verify user profile and type (also warms the profile cache)
+            user_data = load_user_profile(uid)
+            if not user_data:
                 return jsonify({'success': False, 'message': 'User profile not found'})
 
-            user_data = user_doc.to_dict()
             if user_data.get('user_type') != user_type:
                 return jsonify({'success': False, 'message': 'Invalid user type for this account'})
 
@@ -219,16 +347,23 @@ def signup():
             user_data = {
                 'uid': uid,
                 'name': name,
+                'name_lower': name_search_key(name),
                 'email': email,
                 'user_type': 'student',
                 'department': data.get('department'),
                 'cgpa': float(data.get('cgpa', 0)),
                 'skills': data.get('skills', []),
                 'resume_url': '',
+                **student_search_fields(data.get('skills', []), ''),
                 'created_at': datetime.now()
             }
 
             db.collection('users').document(uid).set(user_data)
+            invalidate_user_profile(uid)
+            invalidate_count('students')
+            invalidate_count('students:high_cgpa')
+            invalidate_count('users')
+            eligibility_index.upsert_student(uid, user_data)
 
             # Sign in to get tokens
             auth_resp = pyre_auth.sign_in_with_email_and_password(email, password)
@@ -258,6 +393,273 @@ def logout():
     session.clear()
     return redirect(url_for('home'))
 
+# ==================== PLACEMENT DRIVE HELPERS ====================
+
+# Fields each list view renders. List queries select() only these; the detail
+# endpoints (GET /api/drives/<id>, GET /api/training/<id>) return the full document.
+LIST_PROJECTIONS = {
+    # Open drives catalog: student dashboard/placements, /api/drives, eligibility index
+    'open_drives': ['company_name', 'job_role', 'description', 'eligibility_criteria',
+                    'skills_required', 'last_date_to_apply', 'posted_by', 'created_at'],
+    'officer_drives': ['company_name', 'job_role', 'description', 'eligibility_criteria',
+                       'skills_required', 'last_date_to_apply', 'created_at'],
+    # Student placements and officer training pages
+    'training': ['title', 'description', 'resource_type', 'resource_url', 'tags', 'upload_date', 'created_at'],
+}
+
+# Helper function to parse a drive deadline into an aware UTC datetime.
+# Accepts datetimes/Timestamps, ISO 8601 strings and bare dates (open until the end of that day).
+def parse_deadline(value):
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if not isinstance(value, str) or not value.strip():
+        return None
+    text = value.strip()
+    try:
+        if len(text) == 10:
+            day = datetime.strptime(text, '%Y-%m-%d')
+            return datetime(day.year, day.month, day.day, 23, 59, 59, tzinfo=timezone.utc)
+        parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+# Helper function to add template-friendly aliases to a drive while keeping schema fields
+def drive_aliases(doc_id, drive_data):
+    alias = {**drive_data, 'id': doc_id}
+    alias['position'] = drive_data.get('job_role')
+    alias['deadline'] = parse_deadline(drive_data.get('last_date_to_apply'))
+    elig = drive_data.get('eligibility_criteria') or {}
+    alias['min_cgpa'] = (elig.get('cgpa') if isinstance(elig, dict) else None)
+    alias['departments'] = (elig.get('departments') if isinstance(elig, dict) else [])
+    alias['requirements'] = drive_data.get('skills_required', [])
+    return alias
+
+# Helper function to add template-friendly aliases to a training material
+def training_aliases(doc_id, training_data):
+    alias = {**training_data, 'id': doc_id}
+    alias['type'] = training_data.get('resource_type')
+    alias['link'] = training_data.get('resource_url')
+    if 'description' not in alias:
+        tags = training_data.get('tags') or []
+        alias['description'] = ', '.join(tags) if tags else ''
+    return alias
+
+# Helper function to fetch drives still open for applications, soonest deadline first.
+# Single-field range + order on last_date_to_apply, so no composite index is needed.
+def query_open_drives(limit=None):
+    query = (db.collection('placement_drives')
+             .where('last_date_to_apply', '>', datetime.now(timezone.utc))
+             .order_by('last_date_to_apply')
+             .select(LIST_PROJECTIONS['open_drives']))
+    if limit:
+        query = query.limit(limit)
+    return [drive_aliases(doc.id, doc.to_dict()) for doc in query.stream()]
+
+# Open drives change a few times a day but are read on every dashboard/placements load,
+# so they are served from a read-through cache invalidated by drive writes
+DRIVE_CATALOG_TTL = float(os.getenv('DRIVE_CATALOG_TTL', '300'))
+drive_catalog = CatalogCache(db, 'open_drives', query_open_drives, ttl=DRIVE_CATALOG_TTL)
+
+# Helper function to get open drives from the catalog cache
+def get_open_drives(limit=None):
+    # Skip drives whose deadline passed since the catalog was loaded
+    now = datetime.now(timezone.utc)
+    drives = [d for d in drive_catalog.get() if d['deadline'] and d['deadline'] > now]
+    return drives[:limit] if limit else drives
+
+# Student/drive eligibility is answered from an in-memory index kept current by
+# profile and drive writes, and rebuilt from Firestore every ELIGIBILITY_INDEX_TTL seconds
+ELIGIBILITY_INDEX_TTL = float(os.getenv('ELIGIBILITY_INDEX_TTL', '600'))
+ELIGIBILITY_STUDENT_FIELDS = ['name', 'email', 'department', 'cgpa', 'skills', 'skills_normalized']
+
+def load_eligibility_students():
+    query = db.collection('users').where('user_type', '==', 'student').select(ELIGIBILITY_STUDENT_FIELDS)
+    return [(doc.id, doc.to_dict()) for doc in query.stream()]
+
+def load_eligibility_drives():
+    return [(drive['id'], drive) for drive in get_open_drives()]
+
+eligibility_index = EligibilityIndex(load_eligibility_students, load_eligibility_drives, ttl=ELIGIBILITY_INDEX_TTL)
+
+# Helper function to reflect a drive write in the eligibility index (closed drives are dropped)
+def index_drive(drive_id, drive_data):
+    alias = drive_aliases(drive_id, drive_data)
+    if alias['deadline'] and alias['deadline'] > datetime.now(timezone.utc):
+        eligibility_index.upsert_drive(drive_id, alias)
+    else:
+        eligibility_index.remove_drive(drive_id)
+
+# ==================== STUDY PLAN HELPERS ====================
+
+# Tasks live in study_plans/{plan_id}/tasks/{task_id}, one document per task, and carry
+# user_id so all of a student's tasks are a single collection-group query.
+# API task IDs are "{plan_id}:{task_id}". IDs from before the move ("{plan_id}_{title}")
+# still resolve through the legacy_id field written by the migration.
+TASK_DONE_STATUSES = ('done', 'completed')
+MAX_TASKS_PER_REQUEST = 100
+TASK_ID_PATTERN = re.compile(r'^([A-Za-z0-9]+)([:_])(.+)$', re.DOTALL)
+
+# Helper function to parse a task due date ('YYYY-MM-DD' or datetime) into a UTC datetime
+def parse_due_date(value):
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, str) and value.strip():
+        try:
+            return datetime.strptime(value.strip()[:10], '%Y-%m-%d').replace(tzinfo=timezone.utc)
+        except ValueError:
+            return None
+    return None
+
+# Build a task document for the tasks subcollection
+def task_document(user_id, title, due_date, status='pending', legacy_id=None):
+    task = {
+        'user_id': user_id,
+        'task': title,
+        'due_date': parse_due_date(due_date),
+        'status': status or 'pending',
+        'created_at': datetime.now(timezone.utc)
+    }
+    if legacy_id:
+        task['legacy_id'] = legacy_id
+    return task
+
+# Convert a task document into the JSON shape used by the study planner
+def serialize_task(plan_id, task_id, task_data):
+    status = task_data.get('status', 'pending')
+    due_date = task_data.get('due_date')
+    return {
+        'id': f"{plan_id}:{task_id}",
+        'title': task_data.get('task', ''),
+        'due_date': due_date.strftime('%Y-%m-%d') if isinstance(due_date, datetime) else due_date,
+        'status': status,
+        'plan_id': plan_id,
+        'priority': task_data.get('priority', 'medium'),
+        'description': task_data.get('description', ''),
+        'completed': status in TASK_DONE_STATUSES
+    }
+
+# Move a plan's legacy tasks array into its subcollection.
+# Task IDs are derived from the array position, so re-running never duplicates tasks.
+def migrate_plan_tasks(plan_ref, plan_data):
+    legacy_tasks = plan_data.get('tasks')
+    if legacy_tasks is None:
+        return 0
+    if not isinstance(legacy_tasks, list):
+        legacy_tasks = []
+    user_id = plan_data.get('user_id')
+    writes = []
+    for position, task in enumerate(legacy_tasks):
+        # Malformed entries: a bare string becomes a task title, anything else is dropped
+        if isinstance(task, str):
+            task = {'task': task}
+        elif not isinstance(task, dict):
+            continue
+        title = str(task.get('task') or '')
+        task_id = hashlib.sha1(f"{position}:{title}".encode('utf-8')).hexdigest()[:20]
+        writes.append((plan_ref.collection('tasks').document(task_id), task_document(
+            user_id, title, task.get('due_date'), task.get('status'),
+            legacy_id=f"{plan_ref.id}_{title}"
+        )))
+    # The array is removed in the last batch, once every task has been written
+    for start in range(0, max(len(writes), 1), 499):
+        batch = db.batch()
+        for task_ref, task_data in writes[start:start + 499]:
+            batch.set(task_ref, task_data)
+        if start + 499 >= len(writes):
+            batch.update(plan_ref, {'tasks': firestore.DELETE_FIELD})
+        batch.commit()
+    return len(writes)
+
+# Users whose plans this process has recently checked for legacy task arrays (LRU);
+# an evicted user is simply checked again, which is one cheap query once migrated
+TASKS_MIGRATED_CACHE_SIZE = int(os.getenv('TASKS_MIGRATED_CACHE_SIZE', '10000'))
+_tasks_migrated_users = OrderedDict()
+_tasks_migrated_lock = threading.Lock()
+
+# Lazily migrate a user's plans the first time their tasks are touched in this process
+def migrate_user_tasks(user_id):
+    with _tasks_migrated_lock:
+        if user_id in _tasks_migrated_users:
+            _tasks_migrated_users.move_to_end(user_id)
+            return
+    plans = db.collection('study_plans').where('user_id', '==', user_id).select(['user_id', 'tasks']).stream()
+    for plan_doc in plans:
+        plan_data = plan_doc.to_dict()
+        if 'tasks' in plan_data:
+            migrate_plan_tasks(plan_doc.reference, plan_data)
+    with _tasks_migrated_lock:
+        _tasks_migrated_users[user_id] = True
+        _tasks_migrated_users.move_to_end(user_id)
+        while len(_tasks_migrated_users) > TASKS_MIGRATED_CACHE_SIZE:
+            _tasks_migrated_users.popitem(last=False)
+
+# Query over all of a user's tasks, across their plans
+def user_tasks_query(user_id):
+    migrate_user_tasks(user_id)
+    return db.collection_group('tasks').where('user_id', '==', user_id)
+
+# Helper function to find the user's study plan (the one new tasks are added to)
+def get_user_plan(user_id):
+    for plan_doc in db.collection('study_plans').where('user_id', '==', user_id).limit(1).stream():
+        return plan_doc
+    return None
+
+# Resolve an API task ID (new or legacy format) to its document.
+# Returns (task_ref, task_data, error); error is an (message, status) pair when not found.
+# snapshots optionally maps document paths to already-fetched snapshots (see db.get_all).
+def resolve_task(user_id, task_id, snapshots=None):
+    match = TASK_ID_PATTERN.match(task_id) if isinstance(task_id, str) else None
+    if not match:
+        return None, None, ('Invalid task ID format', 400)
+    plan_id, separator, rest = match.groups()
+    plan_ref = db.collection('study_plans').document(plan_id)
+
+    if separator == ':':
+        task_ref = plan_ref.collection('tasks').document(rest)
+        task_doc = (snapshots or {}).get(task_ref.path) or task_ref.get()
+        if not task_doc.exists:
+            return None, None, ('Task not found', 404)
+    else:
+        # Legacy "{plan_id}_{title}" ID: make sure the plan has been migrated, then look it up
+        plan_doc = plan_ref.get()
+        if not plan_doc.exists:
+            return None, None, ('Study plan not found', 404)
+        plan_data = plan_doc.to_dict()
+        if plan_data.get('user_id') != user_id:
+            return None, None, ('Unauthorized', 403)
+        if 'tasks' in plan_data:
+            migrate_plan_tasks(plan_ref, plan_data)
+        matches = list(plan_ref.collection('tasks').where('legacy_id', '==', task_id).limit(1).stream())
+        if not matches:
+            return None, None, ('Task not found', 404)
+        task_doc = matches[0]
+        task_ref = task_doc.reference
+
+    task_data = task_doc.to_dict()
+    if task_data.get('user_id') != user_id:
+        return None, None, ('Unauthorized', 403)
+    return task_ref, task_data, None
+
+# Map client task fields (title, due_date, status/completed, description, priority)
+# onto task document fields; returns an empty dict when nothing is updatable
+def task_update_fields(data):
+    update_data = {}
+    if 'title' in data:
+        update_data['task'] = data['title']
+    if 'due_date' in data:
+        update_data['due_date'] = parse_due_date(data['due_date'])
+    if 'status' in data:
+        update_data['status'] = data['status']
+    elif 'completed' in data:
+        update_data['status'] = 'completed' if data['completed'] else 'pending'
+    for field in ('description', 'priority'):
+        if field in data:
+            update_data[field] = data[field]
+    if update_data:
+        update_data['updated_at'] = datetime.now(timezone.utc)
+    return update_data
+
 # ==================== DASHBOARD ROUTES ====================
 
 @app.route('/dashboard')
@@ -275,94 +677,65 @@ def dashboard():
 def student_dashboard():
     user = get_current_user()
     
-    # Get upcoming tasks from study_plans collection (new schema)
+    # Get the next pending tasks: dated ones soonest first, then undated ones
     upcoming_tasks = []
     try:
-        study_plans_ref = db.collection('study_plans').where('user_id', '==', user['id']).stream()
-        for plan_doc in study_plans_ref:
-            plan_data = plan_doc.to_dict()
-            if 'tasks' in plan_data:
-                for task in plan_data['tasks']:
-                    if task.get('status') == 'pending':
-                        # Normalize due_date to datetime or None
-                        raw_due = task.get('due_date')
-                        parsed_due = None
-                        if isinstance(raw_due, str):
-                            try:
-                                parsed_due = datetime.strptime(raw_due.strip(), '%Y-%m-%d')
-                            except Exception:
-                                parsed_due = None
-                        elif hasattr(raw_due, 'isoformat'):
-                            # Firestore Timestamp or datetime
-                            try:
-                                parsed_due = raw_due
-                            except Exception:
-                                parsed_due = None
-
-                        upcoming_tasks.append({
-                            'id': f"{plan_doc.id}_{task.get('task', '')}",
-                            'title': task.get('task', ''),
-                            'due_date': parsed_due,
-                            'status': task.get('status', 'pending')
-                        })
-        
-        # Sort by due date (None last) and limit to 5
-        upcoming_tasks.sort(key=lambda x: (x.get('due_date') is None, x.get('due_date') or datetime.max))
-        upcoming_tasks = upcoming_tasks[:5]
+        pending = user_tasks_query(user['id']).where('status', '==', 'pending')
+        task_docs = list(pending.where('due_date', '>=', datetime(1970, 1, 1, tzinfo=timezone.utc))
+                         .order_by('due_date').limit(5).stream())
+        if len(task_docs) < 5:
+            task_docs += list(pending.where('due_date', '==', None).limit(5 - len(task_docs)).stream())
+        for task_doc in task_docs:
+            task_data = task_doc.to_dict()
+            upcoming_tasks.append({
+                'id': f"{task_doc.reference.parent.parent.id}:{task_doc.id}",
+                'title': task_data.get('task', ''),
+                'due_date': task_data.get('due_date'),
+                'status': task_data.get('status', 'pending')
+            })
         
     except Exception as e:
         # Handle index errors gracefully
         print(f"Error fetching tasks: {e}")
         upcoming_tasks = []
     
-    # Get placement drives
+    # Get placement drives (soonest deadlines first, closed drives are never read)
     upcoming_drives = []
     try:
-        drives_ref = db.collection('placement_drives').stream()
-        for doc in drives_ref:
-            drive_data = doc.to_dict()
-            # Check if drive is still open for applications
-            if 'last_date_to_apply' in drive_data:
-                last_date = drive_data['last_date_to_apply']
-                if isinstance(last_date, str):
-                    from datetime import datetime
-                    try:
-                        last_date = datetime.fromisoformat(last_date.replace('Z', '+00:00'))
-                    except:
-                        last_date = datetime.now()
-                
-                if last_date > datetime.now(timezone.utc):
-                    # Add template-friendly aliases while keeping schema
-                    alias = {**drive_data, 'id': doc.id}
-                    alias['position'] = drive_data.get('job_role')
-                    # Normalize deadline to datetime or None for template strftime
-                    deadline_raw = drive_data.get('last_date_to_apply')
-                    deadline_dt = None
-                    if isinstance(deadline_raw, str):
-                        try:
-                            deadline_dt = datetime.fromisoformat(deadline_raw.replace('Z', '+00:00'))
-                        except Exception:
-                            deadline_dt = None
-                    elif hasattr(deadline_raw, 'isoformat'):
-                        try:
-                            deadline_dt = deadline_raw
-                        except Exception:
-                            deadline_dt = None
-                    alias['deadline'] = deadline_dt
-                    elig = drive_data.get('eligibility_criteria') or {}
-                    alias['min_cgpa'] = (elig.get('cgpa') if isinstance(elig, dict) else None)
-                    alias['departments'] = (elig.get('departments') if isinstance(elig, dict) else [])
-                    alias['requirements'] = drive_data.get('skills_required', [])
-                    upcoming_drives.append(alias)
-        
-        upcoming_drives = upcoming_drives[:3]
-        
+        upcoming_drives = get_open_drives(limit=3)
     except Exception as e:
         print(f"Error fetching drives: {e}")
         upcoming_drives = []
     
     return render_template('student_dashboard.html', user=user, upcoming_tasks=upcoming_tasks, upcoming_drives=upcoming_drives)
 
+# Firestore's maximum number of values in an `in` filter
+FIRESTORE_IN_LIMIT = 30
+RECENT_APPLICATIONS_LIMIT = 5
+
+# Dashboard counts are served by Firestore count aggregations and cached briefly
+COUNT_CACHE_TTL = float(os.getenv('COUNT_CACHE_TTL', '60'))
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+# Helper function to count a query's documents server-side (no documents are downloaded)
+def cached_count(key, query):
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+    result = query.count(alias='total').get()
+    total = int(result[0][0].value)
+    with _count_cache_lock:
+        _count_cache[key] = (now + COUNT_CACHE_TTL, total)
+    return total
+
+# Drop a cached count after a write that changes it
+def invalidate_count(key):
+    with _count_cache_lock:
+        _count_cache.pop(key, None)
+
 @app.route('/officer/dashboard')
 @login_required
 @require_user_type('placement_officer')
@@ -372,55 +745,62 @@ def officer_dashboard():
     # Get posted drives count
     drives_count = 0
     try:
-        drives_count = len(list(db.collection('placement_drives').where('posted_by', '==', user['id']).stream()))
+        drives_count = cached_count(f"drives:{user['id']}", db.collection('placement_drives').where('posted_by', '==', user['id']))
     except Exception as e:
         print(f"Error fetching drives count: {e}")
     
     # Get active students count
     students_count = 0
     try:
-        students_count = len(list(db.collection('users').where('user_type', '==', 'student').stream()))
+        students_count = cached_count('students', db.collection('users').where('user_type', '==', 'student'))
     except Exception as e:
         print(f"Error fetching students count: {e}")
     
     # Get recent applications
     recent_applications = []
     try:
-        # Get drives posted by this officer
-        officer_drives = []
-        drives_ref = db.collection('placement_drives').where('posted_by', '==', user['id']).stream()
-        for doc in drives_ref:
-            officer_drives.append(doc.id)
+        # Get drives posted by this officer (projected: only the IDs are needed)
+        drives_ref = db.collection('placement_drives').where('posted_by', '==', user['id']).select(['posted_by']).stream()
+        officer_drives = [doc.id for doc in drives_ref]
         
-        if officer_drives:
-            # Get applications for these drives
-            applications_ref = db.collection('applications').stream()
-            for doc in applications_ref:
-                app_data = doc.to_dict()
-                if app_data.get('drive_id') in officer_drives:
-                    student_doc = db.collection('users').document(app_data['student_id']).get()
-                    if student_doc.exists:
-                        app_data['student_name'] = student_doc.to_dict()['name']
-                        app_data['id'] = doc.id
-                        # Normalize applied_at to datetime or None
-                        applied_raw = app_data.get('applied_at')
-                        if isinstance(applied_raw, str):
-                            try:
-                                app_data['applied_at'] = datetime.fromisoformat(applied_raw.replace('Z', '+00:00'))
-                            except Exception:
-                                app_data['applied_at'] = None
-                        elif hasattr(applied_raw, 'isoformat'):
-                            try:
-                                app_data['applied_at'] = applied_raw
-                            except Exception:
-                                app_data['applied_at'] = None
-                        else:
-                            app_data['applied_at'] = None
-                        recent_applications.append(app_data)
+        # Indexed `drive_id in [...]` queries (composite index: drive_id, applied_at desc),
+        # one per chunk of drive IDs, each limited to the 5 newest
+        app_docs = []
+        for i in range(0, len(officer_drives), FIRESTORE_IN_LIMIT):
+            chunk = officer_drives[i:i + FIRESTORE_IN_LIMIT]
+            query = (db.collection('applications')
+                     .where('drive_id', 'in', chunk)
+                     .order_by('applied_at', direction=firestore.Query.DESCENDING)
+                     .limit(RECENT_APPLICATIONS_LIMIT))
+            app_docs.extend(query.stream())
+        
+        for doc in app_docs:
+            app_data = doc.to_dict()
+            app_data['id'] = doc.id
+            # Normalize applied_at to datetime or None
+            applied_raw = app_data.get('applied_at')
+            if isinstance(applied_raw, str):
+                try:
+                    app_data['applied_at'] = datetime.fromisoformat(applied_raw.replace('Z', '+00:00'))
+                except Exception:
+                    app_data['applied_at'] = None
+            elif not hasattr(applied_raw, 'isoformat'):
+                app_data['applied_at'] = None
+            recent_applications.append(app_data)
         
-        # Sort by applied_at (None last) and limit to 5
-        recent_applications.sort(key=lambda x: (x.get('applied_at') is None, x.get('applied_at') or datetime.min), reverse=True)
-        recent_applications = recent_applications[:5]
+        # Merge chunks: sort by applied_at (None last) and limit to 5
+        recent_applications.sort(key=lambda x: (x.get('applied_at') is not None, x.get('applied_at') or datetime.min), reverse=True)
+        recent_applications = recent_applications[:RECENT_APPLICATIONS_LIMIT]
+        
+        # Names are denormalized at apply time; fetch any missing ones in one batched read
+        missing = {a['student_id'] for a in recent_applications if not a.get('student_name') and a.get('student_id')}
+        if missing:
+            refs = [db.collection('users').document(uid) for uid in missing]
+            names = {snap.id: (snap.to_dict() or {}).get('name') for snap in db.get_all(refs, field_paths=['name']) if snap.exists}
+            for application in recent_applications:
+                if not application.get('student_name'):
+                    application['student_name'] = names.get(application.get('student_id'))
+        recent_applications = [a for a in recent_applications if a.get('student_name')]
         
     except Exception as e:
         print(f"Error fetching applications: {e}")
@@ -456,42 +836,22 @@ def student_quizgen():
 def student_studyplanner():
     user = get_current_user()
     
-    # Get all tasks for the user (removed order_by to avoid index requirement)
-    # Note: If ordering by due_date is required, create composite index: user_id (Ascending), due_date (Ascending)
-    tasks_ref = db.collection('study_plans').where('user_id', '==', user['id']).stream()
+    # Get all tasks for the user from the tasks subcollections
     tasks = []
-    for plan_doc in tasks_ref:
-        plan_data = plan_doc.to_dict()
-        if 'tasks' in plan_data:
-            for task in plan_data['tasks']:
-                # Normalize due_date to datetime or None
-                raw_due = task.get('due_date')
-                parsed_due = None
-                if isinstance(raw_due, str):
-                    try:
-                        parsed_due = datetime.strptime(raw_due.strip(), '%Y-%m-%d')
-                    except Exception:
-                        parsed_due = None
-                elif hasattr(raw_due, 'isoformat'):
-                    try:
-                        parsed_due = raw_due
-                    except Exception:
-                        parsed_due = None
-                tasks.append({
-                    'id': f"{plan_doc.id}_{task.get('task', '')}",
-                    'title': task.get('task', ''),
-                    'due_date': parsed_due,
-                    'status': task.get('status', 'pending'),
-                    'plan_id': plan_doc.id,
-                    'priority': 'medium',
-                    'description': '',
-                    'completed': task.get('status', 'pending') in ['done', 'completed']
-                })
-    
-    # Sort in Python to avoid Firestore index requirement (None last)
-    tasks.sort(key=lambda x: (x.get('due_date') is None, x.get('due_date') or datetime.max))
-    
-    return render_template('student_studyplanner.html', user=user, tasks=tasks)
+    try:
+        for task_doc in user_tasks_query(user['id']).stream():
+            task_data = task_doc.to_dict()
+            task = serialize_task(task_doc.reference.parent.parent.id, task_doc.id, task_data)
+            task['due_date'] = task_data.get('due_date')
+            tasks.append(task)
+    except Exception as e:
+        print(f"Error fetching tasks: {e}")
+    
+    # Sort by due date (None last)
+    tasks.sort(key=lambda x: (x.get('due_date') is None, x.get('due_date') or datetime.max.replace(tzinfo=timezone.utc)))
+    
+    return render_template('student_studyplanner.html', user=user, tasks=tasks,
+                           max_batch_operations=MAX_TASKS_PER_REQUEST)
 
 @app.route('/student/resume')
 @login_required
@@ -506,47 +866,17 @@ def student_resume():
 def student_placements():
     user = get_current_user()
     
-    # Get all placement drives (removed order_by to avoid index requirement)
-    # Note: If ordering by date is required, create composite index: active (Ascending), date (Ascending)
-    drives_ref = db.collection('placement_drives').stream()
-    drives = []
-    for doc in drives_ref:
-        drive_data = doc.to_dict()
-        # Check if drive is still open for applications
-        if 'last_date_to_apply' in drive_data:
-            last_date = drive_data['last_date_to_apply']
-            if isinstance(last_date, str):
-                try:
-                    last_date = datetime.fromisoformat(last_date.replace('Z', '+00:00'))
-                except:
-                    last_date = datetime.now()
-            
-            if last_date > datetime.now(timezone.utc):
-                alias = {**drive_data, 'id': doc.id}
-                alias['position'] = drive_data.get('job_role')
-                alias['deadline'] = drive_data.get('last_date_to_apply')
-                elig = drive_data.get('eligibility_criteria') or {}
-                alias['min_cgpa'] = (elig.get('cgpa') if isinstance(elig, dict) else None)
-                alias['departments'] = (elig.get('departments') if isinstance(elig, dict) else [])
-                alias['requirements'] = drive_data.get('skills_required', [])
-                drives.append(alias)
-    
-    # Sort in Python to avoid Firestore index requirement
-    drives.sort(key=lambda x: x.get('last_date_to_apply', ''))
+    # Get open placement drives, ordered by deadline in Firestore
+    try:
+        drives = get_open_drives()
+    except Exception as e:
+        print(f"Error fetching drives: {e}")
+        drives = []
     
     # Get training materials (removed order_by to avoid index requirement)
     # Note: If ordering by upload_date is required, create composite index: upload_date (Ascending)
-    training_ref = db.collection('training_resources').stream()
-    training_materials = []
-    for tdoc in training_ref:
-        tdata = tdoc.to_dict()
-        alias = {**tdata, 'id': tdoc.id}
-        alias['type'] = tdata.get('resource_type')
-        alias['link'] = tdata.get('resource_url')
-        if 'description' not in alias:
-            tags = tdata.get('tags') or []
-            alias['description'] = ', '.join(tags) if tags else ''
-        training_materials.append(alias)
+    training_ref = db.collection('training_resources').select(LIST_PROJECTIONS['training']).stream()
+    training_materials = [training_aliases(tdoc.id, tdoc.to_dict()) for tdoc in training_ref]
     
     # Sort in Python to avoid Firestore index requirement
     training_materials.sort(key=lambda x: x.get('upload_date', ''), reverse=True)
@@ -558,12 +888,8 @@ def student_placements():
 @require_user_type('student')
 def student_messages():
     user = get_current_user()
-    
-    # Get all users for chat
-    users_ref = db.collection('users').stream()
-    users = [{**doc.to_dict(), 'id': doc.id} for doc in users_ref if doc.id != user['id']]
-    
-    return render_template('student_messages.html', user=user, users=users)
+    # Contacts are loaded page by page from /api/contacts
+    return render_template('student_messages.html', user=user)
 
 # ==================== OFFICER FEATURE ROUTES ====================
 
@@ -575,8 +901,9 @@ def officer_drives():
     
     # Get all drives posted by this officer (removed order_by to avoid index requirement)
     # Note: If ordering by created_at is required, create composite index: posted_by (Ascending), created_at (Ascending)
-    drives_ref = db.collection('placement_drives').where('posted_by', '==', user['id']).stream()
-    drives = [{**doc.to_dict(), 'id': doc.id} for doc in drives_ref]
+    drives_ref = (db.collection('placement_drives').where('posted_by', '==', user['id'])
+                  .select(LIST_PROJECTIONS['officer_drives']).stream())
+    drives = [drive_aliases(doc.id, doc.to_dict()) for doc in drives_ref]
     
     # Sort in Python to avoid Firestore index requirement
     drives.sort(key=lambda x: x.get('created_at', ''), reverse=True)
@@ -591,8 +918,9 @@ def officer_training():
     
     # Get all training materials posted by this officer (removed order_by to avoid index requirement)
     # Note: If ordering by upload_date is required, create composite index: uploaded_by (Ascending), upload_date (Ascending)
-    materials_ref = db.collection('training_resources').where('uploaded_by', '==', user['id']).stream()
-    materials = [{**doc.to_dict(), 'id': doc.id} for doc in materials_ref]
+    materials_ref = (db.collection('training_resources').where('uploaded_by', '==', user['id'])
+                     .select(LIST_PROJECTIONS['training']).stream())
+    materials = [training_aliases(doc.id, doc.to_dict()) for doc in materials_ref]
     
     # Sort in Python to avoid Firestore index requirement
     materials.sort(key=lambda x: x.get('upload_date', ''), reverse=True)
@@ -605,167 +933,319 @@ def officer_training():
 def officer_filter():
     user = get_current_user()
     
-    # Get all students
-    students_ref = db.collection('users').where('user_type', '==', 'student').stream()
-    students = [{**doc.to_dict(), 'id': doc.id} for doc in students_ref]
+    # Students are fetched page by page from /api/students/search; only summary counts are rendered here
+    stats = {}
+    students_query = db.collection('users').where('user_type', '==', 'student')
+    for key, query in (
+        ('total', students_query),
+        ('with_resume', students_query.where('has_resume', '==', True)),
+        ('high_cgpa', students_query.where('cgpa', '>=', 8.0)),
+    ):
+        try:
+            stats[key] = cached_count('students' if key == 'total' else f"students:{key}", query)
+        except Exception as e:
+            print(f"Error counting students ({key}): {e}")
+            stats[key] = None
     
-    return render_template('officer_filter.html', user=user, students=students)
+    return render_template('officer_filter.html', user=user, stats=stats)
 
 @app.route('/officer/messages')
 @login_required
 @require_user_type('placement_officer')
 def officer_messages():
     user = get_current_user()
-    
-    # Get all users for chat
-    users_ref = db.collection('users').stream()
-    users = [{**doc.to_dict(), 'id': doc.id} for doc in users_ref if doc.id != user['id']]
-    
-    return render_template('officer_messages.html', user=user, users=users)
+    # Contacts are loaded page by page from /api/contacts; only the total is computed here
+    try:
+        contact_count = max(cached_count('users', db.collection('users')) - 1, 0)
+    except Exception as e:
+        print(f"Error counting contacts: {e}")
+        contact_count = None
+    return render_template('officer_messages.html', user=user, contact_count=contact_count)
 
 # ==================== API ENDPOINTS ====================
 
+# Helper function to record AI tool usage (queued; written in batches off the request path)
+def record_ai_usage(user_id, tool_used, input_text, ai_response):
+    usage_writer.add({
+        'user_id': user_id,
+        'tool_used': tool_used,
+        'timestamp': datetime.now(timezone.utc),
+        'input_summary': input_text[:100] + '...' if len(input_text) > 100 else input_text,
+        'ai_response': ai_response[:200] + '...' if len(ai_response) > 200 else ai_response
+    })
+
+# Helper function to check whether the client asked for a streamed response
+def wants_stream(data):
+    return bool(data.get('stream')) or request.args.get('stream') == '1'
+
+# Stream AI output as Server-Sent Events ("chunk" events, then "done");
+# usage is recorded once, when the stream finishes or the client disconnects
+def stream_ai_response(chunks, user_id, tool_used, input_text, done_data=None, headers=None):
+    # Pull the first chunk before responding, so an overloaded AI service
+    # still gets a 429 rather than a stream that fails after it started
+    chunks = iter(chunks)
+    first = next(chunks, None)
+
+    def generate():
+        parts = []
+        try:
+            for chunk in itertools.chain([first] if first is not None else [], chunks):
+                parts.append(chunk)
+                yield sse_event('chunk', {'text': chunk})
+            yield sse_event('done', done_data or {})
+        finally:
+            record_ai_usage(user_id, tool_used, input_text, ''.join(parts))
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+        **(headers or {})
+    })
+
 @app.route('/api/chatbot', methods=['POST'])
 @login_required
+@rate_limited('chatbot')
 def chatbot_api():
     user = get_current_user()
     data = request.get_json()
     prompt = data.get('prompt', '')
-    response = ask_chatbot(prompt)
+    # Conversation memory: an unknown or expired session_id starts a new conversation
+    chat_session = chat_memory.get_or_create(data.get('session_id'), user['id'])
+
+    if wants_stream(data):
+        return stream_ai_response(ask_chatbot_stream(prompt, chat_session), user['id'], 'chatbot', prompt,
+                                  done_data={'session_id': chat_session.id},
+                                  headers={'X-Chat-Session': chat_session.id})
+
+    response = ask_chatbot(prompt, chat_session)
     
     # Track AI usage
-    try:
-        ai_usage_data = {
-            'user_id': user['id'],
-            'tool_used': 'chatbot',
-            'timestamp': datetime.now(),
-            'input_summary': prompt[:100] + '...' if len(prompt) > 100 else prompt,
-            'ai_response': response[:200] + '...' if len(response) > 200 else response
-        }
-        db.collection('ai_usage').add(ai_usage_data)
-    except Exception as e:
-        print(f"Error tracking AI usage: {e}")
+    record_ai_usage(user['id'], 'chatbot', prompt, response)
     
-    return jsonify({'response': response})
+    return jsonify({'response': response, 'session_id': chat_session.id})
+
+@app.route('/api/chatbot/session/<session_id>', methods=['DELETE'])
+@login_required
+def chatbot_session_delete(session_id):
+    user = get_current_user()
+    chat_memory.drop(session_id, user['id'])
+    return jsonify({'success': True})
 
 @app.route('/api/summarize', methods=['POST'])
 @login_required
+@rate_limited('summarize')
 def summarize_api():
     user = get_current_user()
     data = request.get_json()
     text = data.get('text', '')
+
+    if wants_stream(data):
+        return stream_ai_response(summarize_notes_stream(text), user['id'], 'summarizer', text)
+
     summary = summarize_notes(text)
     
     # Track AI usage
-    try:
-        ai_usage_data = {
-            'user_id': user['id'],
-            'tool_used': 'summarizer',
-            'timestamp': datetime.now(),
-            'input_summary': text[:100] + '...' if len(text) > 100 else text,
-            'ai_response': summary[:200] + '...' if len(summary) > 200 else summary
-        }
-        db.collection('ai_usage').add(ai_usage_data)
-    except Exception as e:
-        print(f"Error tracking AI usage: {e}")
+    record_ai_usage(user['id'], 'summarizer', text, summary)
     
     return jsonify({'summary': summary})
 
 @app.route('/api/quizgen', methods=['POST'])
 @login_required
+@rate_limited('quizgen')
 def quiz_api():
     user = get_current_user()
     data = request.get_json()
     text = data.get('text', '')
-    num_questions = data.get('num_questions', 5)
+    num_questions = data.get('num_questions') or data.get('question_count') or 5
+
+    # Structured quiz (JSON questions/options/answer), served from the per-content pool when possible
+    if data.get('format') == 'json':
+        options = structured_quiz_options(data, num_questions)
+        pooled = next_pooled_quiz(text, **options)
+        if pooled is not None:
+            return jsonify({'quiz': pooled, 'pooled': True})
+        if wants_background(data):
+            return submit_ai_job('quizgen_json', user['id'], {'user_id': user['id'], 'text': text, **options})
+        try:
+            return jsonify(run_structured_quiz(user['id'], text, options))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 502
+
+    if wants_stream(data):
+        return stream_ai_response(generate_quiz_stream(text, num_questions), user['id'], 'quizgen', text)
+
+    if wants_background(data):
+        return submit_ai_job('quizgen', user['id'], {
+            'user_id': user['id'],
+            'text': text,
+            'num_questions': num_questions
+        })
+
     quiz = generate_quiz(text, num_questions)
     
     # Track AI usage
-    try:
-        ai_usage_data = {
-            'user_id': user['id'],
-            'tool_used': 'quizgen',
-            'timestamp': datetime.now(),
-            'input_summary': text[:100] + '...' if len(text) > 100 else text,
-            'ai_response': quiz[:200] + '...' if len(quiz) > 200 else quiz
-        }
-        db.collection('ai_usage').add(ai_usage_data)
-    except Exception as e:
-        print(f"Error tracking AI usage: {e}")
+    record_ai_usage(user['id'], 'quizgen', text, quiz)
     
     return jsonify({'quiz': quiz})
 
+# Quiz settings for structured quizzes; seen lists the set ids the client has already shown
+def structured_quiz_options(data, num_questions):
+    seen = data.get('seen') if isinstance(data.get('seen'), list) else []
+    return {
+        'num_questions': num_questions,
+        'difficulty': data.get('difficulty'),
+        'question_type': data.get('question_type'),
+        'seen': [str(set_id) for set_id in seen[:50]]
+    }
+
+def run_structured_quiz(user_id, text, options):
+    quiz, pooled = generate_structured_quiz(text, **options)
+    record_ai_usage(user_id, 'quizgen', text, json.dumps(quiz))
+    return {'quiz': quiz, 'pooled': pooled}
+
+# AI cache and telemetry counters for monitoring
+@app.route('/api/ai/stats', methods=['GET'])
+@login_required
+@require_user_type('placement_officer')
+def ai_stats():
+    return jsonify({
+        'response_cache': response_cache.stats(),
+        'usage_writer': usage_writer.stats(),
+        'jobs': job_queue.stats(),
+        'gemini_limiter': gemini_limiter.stats(),
+        'rate_limits': ai_rate_limiter.stats(),
+        'chat_memory': chat_memory.stats()
+    })
+
 # ==================== STUDY PLANNER AI TASK GENERATION ====================
 
+# Generate study tasks with Gemini and add them to the user's plan.
+# Raises ValueError with a client-facing message when the AI output is unusable.
+def generate_plan_tasks(user_id, study_request, num_tasks=5, plan_title=None):
+    try:
+        num_tasks = max(1, min(int(num_tasks), MAX_TASKS_PER_REQUEST))
+    except (TypeError, ValueError):
+        num_tasks = 5
+
+    # One Gemini call returns the plan title and validated tasks together
+    plan = generate_study_plan(study_request, num_tasks)
+    tasks = plan['tasks']
+
+    # Add the tasks to the user's study plan (created if missing), one document each
+    plan_doc = get_user_plan(user_id)
+    if plan_doc:
+        plan_ref = plan_doc.reference
+    else:
+        plan_ref = db.collection('study_plans').document()
+    batch = db.batch()
+    if not plan_doc:
+        batch.set(plan_ref, {
+            'user_id': user_id,
+            'title': plan_title or plan['title'] or 'Study Plan',
+            'created_on': datetime.now(timezone.utc)
+        })
+    for t in tasks:
+        batch.set(plan_ref.collection('tasks').document(),
+                  task_document(user_id, t.get('task'), t.get('due_date'), t.get('status')))
+    batch.commit()
+
+    # Track AI usage
+    record_ai_usage(user_id, 'study_tasks_ai', study_request, json.dumps(plan))
+
+    return {'success': True, 'plan_id': plan_ref.id, 'tasks_added': len(tasks)}
+
 @app.route('/api/studyplan/generate', methods=['POST'])
 @login_required
 @require_user_type('student')
+@rate_limited('study_tasks')
 def generate_study_tasks():
     user = get_current_user()
     data = request.get_json() or {}
     study_request = data.get('request') or ''
     num_tasks = data.get('num_tasks', 5)
 
-    # Ask Gemini to produce strict JSON
-    raw = generate_tasks_json(study_request, num_tasks)
+    if wants_background(data):
+        return submit_ai_job('study_tasks', user['id'], {
+            'user_id': user['id'],
+            'request': study_request,
+            'num_tasks': num_tasks,
+            'title': data.get('title')
+        })
 
-    # Parse JSON safely
     try:
-        parsed = json.loads(raw)
-        tasks = parsed.get('tasks') or []
-    except Exception:
-        return jsonify({'error': 'Failed to parse AI response'}), 400
+        return jsonify(generate_plan_tasks(user['id'], study_request, num_tasks, data.get('title')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    if not isinstance(tasks, list) or not tasks:
-        return jsonify({'error': 'No tasks generated'}), 400
+# ==================== BACKGROUND AI JOBS ====================
 
-    # Upsert a single study plan for the user
-    existing_plans = db.collection('study_plans').where('user_id', '==', user['id']).limit(1).stream()
-    plan_doc = None
-    for doc in existing_plans:
-        plan_doc = doc
-        break
+# Seconds clients are asked to wait before retrying when the job queue is full
+JOB_QUEUE_RETRY_AFTER = 5
 
-    if plan_doc:
-        plan_data = plan_doc.to_dict()
-        if 'tasks' not in plan_data:
-            plan_data['tasks'] = []
-        # Normalize tasks
-        for t in tasks:
-            plan_data['tasks'].append({
-                'task': t.get('task'),
-                'due_date': t.get('due_date'),
-                'status': t.get('status') or 'pending'
-            })
-        db.collection('study_plans').document(plan_doc.id).update(plan_data)
-        plan_id = plan_doc.id
-    else:
-        plan_data = {
-            'user_id': user['id'],
-            'title': data.get('title') or 'Study Plan',
-            'created_on': datetime.now(timezone.utc),
-            'tasks': [{
-                'task': t.get('task'),
-                'due_date': t.get('due_date'),
-                'status': t.get('status') or 'pending'
-            } for t in tasks]
-        }
-        doc_ref = db.collection('study_plans').add(plan_data)
-        plan_id = doc_ref[1].id
+# Helper function to check whether the client asked for a background job
+def wants_background(data):
+    return bool(data.get('async')) or request.args.get('async') == '1'
 
-    # Track AI usage
+# Queue an AI job and answer 202 with its id (503 when the queue is full)
+def submit_ai_job(kind, user_id, payload):
     try:
-        db.collection('ai_usage').add({
-            'user_id': user['id'],
-            'tool_used': 'study_tasks_ai',
-            'timestamp': datetime.now(timezone.utc),
-            'input_summary': (study_request[:100] + '...') if len(study_request) > 100 else study_request,
-            'ai_response': (raw[:200] + '...') if len(raw) > 200 else raw
-        })
+        job_id = job_queue.submit(kind, user_id, payload)
+    except QueueFull:
+        response = jsonify({'error': 'Too many AI jobs in progress, please retry shortly'})
+        response.headers['Retry-After'] = str(JOB_QUEUE_RETRY_AFTER)
+        return response, 503
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('get_job', job_id=job_id)
+    }), 202
+
+def run_quiz_job(payload):
+    quiz = generate_quiz(payload['text'], payload['num_questions'])
+    record_ai_usage(payload['user_id'], 'quizgen', payload['text'], quiz)
+    return {'quiz': quiz}
+
+def run_structured_quiz_job(payload):
+    options = {k: payload.get(k) for k in ('num_questions', 'difficulty', 'question_type', 'seen')}
+    return run_structured_quiz(payload['user_id'], payload['text'], options)
+
+def run_study_tasks_job(payload):
+    return generate_plan_tasks(payload['user_id'], payload['request'], payload['num_tasks'], payload.get('title'))
+
+job_queue.register('quizgen', run_quiz_job)
+job_queue.register('quizgen_json', run_structured_quiz_job)
+job_queue.register('study_tasks', run_study_tasks_job)
+
+# Re-run persisted jobs once this process starts serving requests. Not at import time: the
+# debug reloader imports the app in a watcher process that never serves, and running
+# recovery there as well would execute the same jobs twice.
+_jobs_recovered = False
+_jobs_recovered_lock = threading.Lock()
+
+@app.before_request
+def recover_ai_jobs():
+    global _jobs_recovered
+    if _jobs_recovered:
+        return
+    with _jobs_recovered_lock:
+        if _jobs_recovered:
+            return
+        _jobs_recovered = True
+    try:
+        job_queue.recover()
     except Exception as e:
-        print(f"Error tracking AI usage (study tasks): {e}")
+        print(f"AI job recovery failed: {e}")
 
-    return jsonify({'success': True, 'plan_id': plan_id, 'tasks_added': len(tasks)})
+# Status and result of a background job (only visible to the user who submitted it)
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    user = get_current_user()
+    job = job_queue.get(job_id)
+    if job is None or job['owner'] != user['id']:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    job.pop('owner', None)
+    return jsonify(job)
 
 # ==================== STUDY PLANNER API ====================
 
@@ -776,25 +1256,11 @@ def get_tasks():
     tasks = []
     
     try:
-        # Get tasks from study_plans collection (new schema)
-        study_plans_ref = db.collection('study_plans').where('user_id', '==', user['id']).stream()
-        for plan_doc in study_plans_ref:
-            plan_data = plan_doc.to_dict()
-            if 'tasks' in plan_data:
-                for task in plan_data['tasks']:
-                    tasks.append({
-                        'id': f"{plan_doc.id}_{task.get('task', '')}",
-                        'title': task.get('task', ''),
-                        'due_date': task.get('due_date'),
-                        'status': task.get('status', 'pending'),
-                        'plan_id': plan_doc.id,
-                        'priority': 'medium',
-                        'description': '',
-                        'completed': task.get('status', 'pending') in ['done', 'completed']
-                    })
+        for task_doc in user_tasks_query(user['id']).stream():
+            tasks.append(serialize_task(task_doc.reference.parent.parent.id, task_doc.id, task_doc.to_dict()))
         
         # Sort by due date
-        tasks.sort(key=lambda x: x.get('due_date', ''))
+        tasks.sort(key=lambda x: x.get('due_date') or '')
         
     except Exception as e:
         print(f"Error fetching tasks: {e}")
@@ -815,92 +1281,120 @@ def create_task():
     due_date = data.get('due_date')
     
     # Check if user has an existing study plan
-    existing_plans = db.collection('study_plans').where('user_id', '==', user['id']).limit(1).stream()
-    plan_doc = None
-    
-    for doc in existing_plans:
-        plan_doc = doc
-        break
+    plan_doc = get_user_plan(user['id'])
     
     if plan_doc:
-        # Update existing plan
-        plan_data = plan_doc.to_dict()
-        if 'tasks' not in plan_data:
-            plan_data['tasks'] = []
-        
-        plan_data['tasks'].append({
-            'task': task_title,
-            'due_date': due_date,
-            'status': 'pending'
-        })
-        
-        db.collection('study_plans').document(plan_doc.id).update(plan_data)
-        plan_id = plan_doc.id
+        plan_ref = plan_doc.reference
     else:
-        # Generate title using Gemini API if not provided
+        # Name the plan after its first task; no model round trip before the first write
         if not plan_title or plan_title == 'Study Plan':
-            try:
-                from ai_modules.gemini_config import generate_title
-                plan_title = generate_title(f"Study plan for: {task_title}")
-            except:
-                plan_title = f"Study Plan - {task_title}"
+            plan_title = f"Study Plan - {task_title}" if task_title else 'Study Plan'
         
         # Create new plan
-        plan_data = {
+        _, plan_ref = db.collection('study_plans').add({
             'user_id': user['id'],
             'title': plan_title,
-            'created_on': datetime.now(),
-            'tasks': [{
-                'task': task_title,
-                'due_date': due_date,
-                'status': 'pending'
-            }]
-        }
-        
-        doc_ref = db.collection('study_plans').add(plan_data)
-        plan_id = doc_ref[1].id
+            'created_on': datetime.now()
+        })
     
-    return jsonify({
-        'id': f"{plan_id}_{task_title}",
-        'title': task_title,
-        'due_date': due_date,
-        'status': 'pending',
-        'plan_id': plan_id,
-        'priority': 'medium',
-        'description': '',
-        'completed': False
-    })
+    # Single-document write; concurrent edits to other tasks are unaffected
+    task_data = task_document(user['id'], task_title, due_date)
+    _, task_ref = plan_ref.collection('tasks').add(task_data)
+    
+    return jsonify(serialize_task(plan_ref.id, task_ref.id, task_data))
+
+# Apply several create/update/delete operations in one request and one atomic batch.
+# Body: {"operations": [{"op": "create", "title": ..., "due_date": ...},
+#                       {"op": "update", "id": ..., "completed": true},
+#                       {"op": "delete", "id": ...}]}
+# Each operation gets a result; invalid ones are reported and skipped, the rest commit together.
+@app.route('/api/tasks/batch', methods=['POST'])
+@login_required
+def batch_tasks():
+    user = get_current_user()
+    data = request.get_json() or {}
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'operations must be a non-empty list'}), 400
+    if len(operations) > MAX_TASKS_PER_REQUEST:
+        return jsonify({'error': f'At most {MAX_TASKS_PER_REQUEST} operations per request'}), 400
+
+    try:
+        # Fetch every new-format task in one round trip
+        refs = []
+        for op in operations:
+            task_id = op.get('id') if isinstance(op, dict) else None
+            match = TASK_ID_PATTERN.match(task_id) if isinstance(task_id, str) else None
+            if match and match.group(2) == ':':
+                refs.append(db.collection('study_plans').document(match.group(1)).collection('tasks').document(match.group(3)))
+        snapshots = {snap.reference.path: snap for snap in db.get_all(refs)} if refs else {}
+
+        batch = db.batch()
+        results = []
+        plan_ref = None
+        for index, op in enumerate(operations):
+            kind = op.get('op') if isinstance(op, dict) else None
+            if kind == 'create':
+                if not op.get('title'):
+                    results.append({'index': index, 'op': kind, 'success': False, 'error': 'title is required'})
+                    continue
+                if plan_ref is None:
+                    plan_doc = get_user_plan(user['id'])
+                    plan_ref = plan_doc.reference if plan_doc else db.collection('study_plans').document()
+                    if not plan_doc:
+                        batch.set(plan_ref, {
+                            'user_id': user['id'],
+                            'title': data.get('plan_title') or 'Study Plan',
+                            'created_on': datetime.now(timezone.utc)
+                        })
+                task_ref = plan_ref.collection('tasks').document()
+                task_data = task_document(user['id'], op['title'], op.get('due_date'))
+                batch.set(task_ref, task_data)
+                results.append({'index': index, 'op': kind, 'success': True,
+                                'task': serialize_task(plan_ref.id, task_ref.id, task_data)})
+            elif kind in ('update', 'delete'):
+                task_ref, task_data, error = resolve_task(user['id'], op.get('id'), snapshots)
+                if error:
+                    results.append({'index': index, 'op': kind, 'id': op.get('id'), 'success': False, 'error': error[0]})
+                    continue
+                if kind == 'delete':
+                    batch.delete(task_ref)
+                else:
+                    update_data = task_update_fields(op)
+                    if not update_data:
+                        results.append({'index': index, 'op': kind, 'id': op.get('id'), 'success': False,
+                                        'error': 'No fields to update'})
+                        continue
+                    batch.update(task_ref, update_data)
+                results.append({'index': index, 'op': kind, 'id': op.get('id'), 'success': True})
+            else:
+                results.append({'index': index, 'op': kind, 'success': False, 'error': 'Unknown op'})
+
+        if any(result['success'] for result in results):
+            batch.commit()
+    except Exception as e:
+        print(f"Error applying task batch: {e}")
+        return jsonify({'error': 'Failed to apply task operations'}), 500
+
+    return jsonify({'results': results, 'applied': sum(1 for r in results if r['success'])})
 
 @app.route('/api/tasks/<task_id>', methods=['PUT'])
 @login_required
 def update_task(task_id):
     user = get_current_user()
-    data = request.get_json()
+    data = request.get_json() or {}
     
     try:
-        # Parse task_id to get plan_id and task_title
-        if '_' in task_id:
-            plan_id, task_title = task_id.split('_', 1)
-        else:
-            return jsonify({'error': 'Invalid task ID format'}), 400
+        task_ref, task_data, error = resolve_task(user['id'], task_id)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
         
-        # Get the study plan
-        plan_doc = db.collection('study_plans').document(plan_id).get()
-        if not plan_doc.exists:
-            return jsonify({'error': 'Study plan not found'}), 404
-        
-        plan_data = plan_doc.to_dict()
-        if plan_data['user_id'] != user['id']:
-            return jsonify({'error': 'Unauthorized'}), 403
-        
-        # Update the specific task
-        if 'tasks' in plan_data:
-            for task in plan_data['tasks']:
-                if task.get('task') == task_title:
-                    task.update(data)
-                    break
+        # Update only the fields the client sent
+        update_data = task_update_fields(data)
+        if not update_data:
+            return jsonify({'error': 'No fields to update'}), 400
         
-        db.collection('study_plans').document(plan_id).update(plan_data)
+        task_ref.update(update_data)
         return jsonify({'message': 'Task updated successfully'})
         
     except Exception as e:
@@ -913,26 +1407,11 @@ def delete_task(task_id):
     user = get_current_user()
     
     try:
-        # Parse task_id to get plan_id and task_title
-        if '_' in task_id:
-            plan_id, task_title = task_id.split('_', 1)
-        else:
-            return jsonify({'error': 'Invalid task ID format'}), 400
-        
-        # Get the study plan
-        plan_doc = db.collection('study_plans').document(plan_id).get()
-        if not plan_doc.exists:
-            return jsonify({'error': 'Study plan not found'}), 404
+        task_ref, task_data, error = resolve_task(user['id'], task_id)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
         
-        plan_data = plan_doc.to_dict()
-        if plan_data['user_id'] != user['id']:
-            return jsonify({'error': 'Unauthorized'}), 403
-        
-        # Remove the specific task
-        if 'tasks' in plan_data:
-            plan_data['tasks'] = [task for task in plan_data['tasks'] if task.get('task') != task_title]
-        
-        db.collection('study_plans').document(plan_id).update(plan_data)
+        task_ref.delete()
         return jsonify({'message': 'Task deleted successfully'})
         
     except Exception as e:
@@ -951,8 +1430,11 @@ def update_resume():
     
     db.collection('users').document(user['id']).update({
         'resume_url': resume_url,
+        'has_resume': bool(resume_url),
         'updated_at': datetime.now()
     })
+    invalidate_user_profile(user['id'])
+    invalidate_count('students:with_resume')
     
     return jsonify({'message': 'Resume updated successfully'})
 
@@ -962,37 +1444,17 @@ def update_resume():
 @login_required
 def get_drives():
     try:
-        drives_ref = db.collection('placement_drives').stream()
-        drives = []
-        for doc in drives_ref:
-            drive_data = doc.to_dict()
-            # Check if drive is still open for applications
-            if 'last_date_to_apply' in drive_data:
-                last_date = drive_data['last_date_to_apply']
-                if isinstance(last_date, str):
-                    try:
-                        last_date = datetime.fromisoformat(last_date.replace('Z', '+00:00'))
-                    except:
-                        last_date = datetime.now()
-                
-                if last_date > datetime.now(timezone.utc):
-                    alias = {**drive_data, 'id': doc.id}
-                    alias['position'] = drive_data.get('job_role')
-                    alias['deadline'] = drive_data.get('last_date_to_apply')
-                    elig = drive_data.get('eligibility_criteria') or {}
-                    alias['min_cgpa'] = (elig.get('cgpa') if isinstance(elig, dict) else None)
-                    alias['departments'] = (elig.get('departments') if isinstance(elig, dict) else [])
-                    alias['requirements'] = drive_data.get('skills_required', [])
-                    drives.append(alias)
-        
-        # Sort by last date to apply
-        drives.sort(key=lambda x: x.get('last_date_to_apply', ''))
-        
+        drives = get_open_drives()
+        for drive in drives:
+            drive['deadline'] = drive['deadline'].isoformat() if drive['deadline'] else None
+            drive['last_date_to_apply'] = drive['deadline']
     except Exception as e:
         print(f"Error fetching drives: {e}")
         drives = []
     
-    return jsonify(drives)
+    response = jsonify(drives)
+    response.headers['X-Catalog-Version'] = str(drive_catalog.version() or 0)
+    return response
 
 @app.route('/api/drives', methods=['POST'])
 @login_required
@@ -1000,6 +1462,12 @@ def get_drives():
 def create_drive():
     user = get_current_user()
     data = request.get_json()
+
+    # Deadline is stored as a Firestore Timestamp so open drives can be queried server-side
+    raw_deadline = data.get('deadline') or data.get('last_date_to_apply')
+    deadline = parse_deadline(raw_deadline)
+    if raw_deadline and deadline is None:
+        return jsonify({'error': 'Invalid deadline', 'message': 'Invalid deadline'}), 400
     
     # Schema-compliant document with fallbacks for client field names
     drive_data = {
@@ -1012,15 +1480,32 @@ def create_drive():
             'departments': data.get('departments', [])
         },
         'skills_required': data.get('requirements', []) or data.get('skills_required', []),
-        'last_date_to_apply': data.get('deadline') or data.get('last_date_to_apply'),
+        'last_date_to_apply': deadline,
         'created_at': datetime.now()
     }
     
     doc_ref = db.collection('placement_drives').add(drive_data)
     drive_data['id'] = doc_ref[1].id
+    index_drive(drive_data['id'], drive_data)
+    drive_data['last_date_to_apply'] = deadline.isoformat() if deadline else None
+    drive_catalog.invalidate()
+    invalidate_count(f"drives:{user['id']}")
     
     return jsonify(drive_data)
 
+# Full drive document (list views only load projected fields)
+@app.route('/api/drives/<drive_id>', methods=['GET'])
+@login_required
+def get_drive(drive_id):
+    drive_doc = db.collection('placement_drives').document(drive_id).get()
+    if not drive_doc.exists:
+        return jsonify({'error': 'Drive not found'}), 404
+
+    drive = drive_aliases(drive_doc.id, drive_doc.to_dict())
+    drive['deadline'] = drive['deadline'].isoformat() if drive['deadline'] else None
+    drive['last_date_to_apply'] = drive['deadline']
+    return jsonify(drive)
+
 @app.route('/api/drives/<drive_id>/apply', methods=['POST'])
 @login_required
 @require_user_type('student')
@@ -1032,9 +1517,10 @@ def apply_drive(drive_id):
     if list(existing_app):
         return jsonify({'error': 'Already applied to this drive'}), 400
     
-    # Create application
+    # Create application (student_name denormalized for the officer dashboard)
     application_data = {
         'student_id': user['id'],
+        'student_name': user.get('name'),
         'drive_id': drive_id,
         'status': 'pending',
         'applied_at': datetime.now()
@@ -1062,6 +1548,11 @@ def update_drive(drive_id):
     drive_data = drive_doc.to_dict()
     if drive_data['posted_by'] != user['id']:
         return jsonify({'error': 'Unauthorized'}), 403
+
+    raw_deadline = data.get('deadline') or data.get('last_date_to_apply')
+    deadline = parse_deadline(raw_deadline)
+    if raw_deadline and deadline is None:
+        return jsonify({'error': 'Invalid deadline', 'message': 'Invalid deadline'}), 400
     
     # Update drive
     update_data = {
@@ -1073,11 +1564,13 @@ def update_drive(drive_id):
             'departments': data.get('departments', [])
         },
         'skills_required': data.get('requirements', []) or data.get('skills_required', []),
-        'last_date_to_apply': data.get('deadline') or data.get('last_date_to_apply'),
+        'last_date_to_apply': deadline,
         'updated_at': datetime.now()
     }
     
     drive_ref.update(update_data)
+    drive_catalog.invalidate()
+    index_drive(drive_id, {**drive_data, **update_data})
     return jsonify({'success': True, 'message': 'Drive updated successfully'})
 
 @app.route('/api/drives/<drive_id>', methods=['DELETE'])
@@ -1099,8 +1592,52 @@ def delete_drive(drive_id):
     
     # Delete drive
     drive_ref.delete()
+    invalidate_count(f"drives:{user['id']}")
+    drive_catalog.invalidate()
+    eligibility_index.remove_drive(drive_id)
     return jsonify({'success': True, 'message': 'Drive deleted successfully'})
 
+# ==================== ELIGIBILITY API ====================
+
+ELIGIBILITY_MAX_RESULTS = 500
+
+# Eligible students for a drive, ranked by how many required skills they have
+@app.route('/api/drives/<drive_id>/eligible-students', methods=['GET'])
+@login_required
+@require_user_type('placement_officer')
+def drive_eligible_students(drive_id):
+    try:
+        limit = min(int(request.args.get('limit', 100)), ELIGIBILITY_MAX_RESULTS)
+        min_overlap = int(request.args.get('min_overlap', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid limit or min_overlap'}), 400
+
+    try:
+        students = eligibility_index.eligible_students(drive_id, limit=limit, min_overlap=min_overlap)
+    except Exception as e:
+        print(f"Error matching students for drive {drive_id}: {e}")
+        return jsonify({'error': 'Eligibility lookup failed'}), 500
+    if students is None:
+        return jsonify({'error': 'Drive not found or closed'}), 404
+
+    return jsonify({'drive_id': drive_id, 'students': students})
+
+# Open drives the current student qualifies for
+@app.route('/api/drives/eligible', methods=['GET'])
+@login_required
+@require_user_type('student')
+def student_eligible_drives():
+    user = get_current_user()
+    try:
+        drives = eligibility_index.eligible_drives(user['id'])
+    except Exception as e:
+        print(f"Error matching drives for {user['id']}: {e}")
+        return jsonify({'error': 'Eligibility lookup failed'}), 500
+
+    for drive in drives or []:
+        drive['deadline'] = drive['deadline'].isoformat() if drive['deadline'] else None
+    return jsonify({'drives': drives or []})
+
 # ==================== TRAINING MATERIALS API ====================
 
 @app.route('/api/training', methods=['POST'])
@@ -1124,6 +1661,15 @@ def create_training():
     
     return jsonify(training_data)
 
+# Full training material document (list views only load projected fields)
+@app.route('/api/training/<training_id>', methods=['GET'])
+@login_required
+def get_training(training_id):
+    training_doc = db.collection('training_resources').document(training_id).get()
+    if not training_doc.exists:
+        return jsonify({'error': 'Training material not found'}), 404
+    return jsonify(training_aliases(training_doc.id, training_doc.to_dict()))
+
 @app.route('/api/training/<training_id>', methods=['PUT'])
 @login_required
 @require_user_type('placement_officer')
@@ -1176,45 +1722,257 @@ def delete_training(training_id):
     training_ref.delete()
     return jsonify({'success': True, 'message': 'Training material deleted successfully'})
 
+# ==================== STUDENT SEARCH API ====================
+
+STUDENT_SEARCH_PAGE_SIZE = 25
+STUDENT_SEARCH_MAX_PAGE_SIZE = 100
+# Fields returned per row (field projection keeps pages small)
+STUDENT_SEARCH_FIELDS = ['name', 'email', 'department', 'cgpa', 'skills', 'resume_url']
+
+# Page cursors carry the sort values of the last row returned, so the next page does
+# not depend on that document still existing (or still matching the filters)
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+# Decode a cursor made by encode_cursor; returns a list of `size` values or None if malformed
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size or not isinstance(values[-1], str) or not values[-1]:
+        return None
+    return values
+
+# Helper function to read an optional float query parameter
+def float_param(name):
+    try:
+        value = request.args.get(name)
+        return float(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+@app.route('/api/students/search', methods=['GET'])
+@login_required
+@require_user_type('placement_officer')
+def search_students():
+    department = (request.args.get('department') or '').strip()
+    cgpa_min = float_param('cgpa_min')
+    cgpa_max = float_param('cgpa_max')
+    skills = normalize_skills(request.args.get('skills') or '')[:FIRESTORE_IN_LIMIT]
+    resume = request.args.get('resume') or ''
+    cursor = request.args.get('cursor')
+    try:
+        limit = int(request.args.get('limit', STUDENT_SEARCH_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = STUDENT_SEARCH_PAGE_SIZE
+    limit = max(1, min(limit, STUDENT_SEARCH_MAX_PAGE_SIZE))
+
+    # All filters run in Firestore; results are ordered by CGPA (highest first)
+    query = db.collection('users').where('user_type', '==', 'student')
+    if department:
+        query = query.where('department', '==', department)
+    if skills:
+        query = query.where('skills_normalized', 'array_contains_any', skills)
+    if resume in ('with_resume', 'without_resume'):
+        query = query.where('has_resume', '==', resume == 'with_resume')
+    if cgpa_min is not None:
+        query = query.where('cgpa', '>=', cgpa_min)
+    if cgpa_max is not None:
+        query = query.where('cgpa', '<=', cgpa_max)
+    # Document ID breaks CGPA ties so the (cgpa, id) cursor is exact
+    query = (query.order_by('cgpa', direction=firestore.Query.DESCENDING)
+             .order_by('__name__', direction=firestore.Query.DESCENDING)
+             .select(STUDENT_SEARCH_FIELDS))
+
+    # Cursor is (cgpa, id) of the last student on the previous page
+    if cursor:
+        values = decode_cursor(cursor, 2)
+        if values is None or not isinstance(values[0], (int, float)):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.start_after([values[0], db.collection('users').document(values[1])])
+
+    try:
+        # Fetch one extra row to know whether another page exists
+        docs = list(query.limit(limit + 1).stream())
+    except Exception as e:
+        print(f"Error searching students: {e}")
+        return jsonify({'error': 'Search failed'}), 500
+
+    students = [{**doc.to_dict(), 'id': doc.id} for doc in docs[:limit]]
+    next_cursor = encode_cursor(students[-1].get('cgpa'), students[-1]['id']) if len(docs) > limit else None
+    return jsonify({'students': students, 'next_cursor': next_cursor})
+
+# ==================== CONTACTS API ====================
+
+CONTACTS_PAGE_SIZE = 30
+CONTACTS_MAX_PAGE_SIZE = 100
+CONTACT_FIELDS = ['name', 'user_type', 'department']
+CONTACT_ROLES = ('student', 'placement_officer')
+
+# Contact directory for the messages pages: name-prefix search, role filter, cursor paging
+@app.route('/api/contacts', methods=['GET'])
+@login_required
+def get_contacts():
+    user = get_current_user()
+    prefix = name_search_key(request.args.get('q'))
+    role = request.args.get('role') or ''
+    cursor = request.args.get('cursor')
+    try:
+        limit = int(request.args.get('limit', CONTACTS_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = CONTACTS_PAGE_SIZE
+    limit = max(1, min(limit, CONTACTS_MAX_PAGE_SIZE))
+
+    # Case-insensitive prefix match as a range on name_lower, in name order
+    query = db.collection('users')
+    if role in CONTACT_ROLES:
+        query = query.where('user_type', '==', role)
+    if prefix:
+        query = query.where('name_lower', '>=', prefix).where('name_lower', '<', prefix + '\uf8ff')
+    query = query.order_by('name_lower').order_by('__name__').select(CONTACT_FIELDS + ['name_lower'])
+
+    # Cursor is (name_lower, id) of the last contact on the previous page
+    if cursor:
+        values = decode_cursor(cursor, 2)
+        if values is None or not isinstance(values[0], str):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.start_after([values[0], db.collection('users').document(values[1])])
+
+    try:
+        docs = list(query.limit(limit + 1).stream())
+    except Exception as e:
+        print(f"Error loading contacts: {e}")
+        return jsonify({'error': 'Failed to load contacts'}), 500
+
+    page = docs[:limit]
+    next_cursor = encode_cursor(page[-1].get('name_lower'), page[-1].id) if len(docs) > limit else None
+    contacts = []
+    for doc in page:
+        if doc.id != user['id']:
+            contact = doc.to_dict()
+            contact.pop('name_lower', None)
+            contacts.append({**contact, 'id': doc.id})
+    return jsonify({'contacts': contacts, 'next_cursor': next_cursor})
+
+# Single contact (e.g. a conversation opened from a link)
+@app.route('/api/contacts/<user_id>', methods=['GET'])
+@login_required
+def get_contact(user_id):
+    doc = db.collection('users').document(user_id).get(field_paths=CONTACT_FIELDS)
+    if not doc.exists:
+        return jsonify({'error': 'Contact not found'}), 404
+    return jsonify({**doc.to_dict(), 'id': doc.id})
+
 # ==================== MESSAGING API ====================
 
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 200
+MESSAGES_STREAM_HEARTBEAT = 15  # seconds between keep-alive comments
+MESSAGES_STREAM_RETRY_MS = 3000
+
+# Canonical key shared by both participants of a one-to-one conversation
+def conversation_key(user_a, user_b):
+    return '_'.join(sorted([str(user_a), str(user_b)]))
+
+# Parse an ISO 8601 query parameter (e.g. a message timestamp) into a datetime
+def parse_iso_param(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.strip().replace('Z', '+00:00').replace(' ', '+'))
+    except Exception:
+        return None
+
+# Convert a message document into the JSON shape used by the chat pages
+def serialize_message(doc_id, msg_data):
+    message = {**msg_data, 'id': doc_id}
+    for field in ('timestamp', 'edited_at', 'read_at'):
+        ts = message.get(field)
+        if hasattr(ts, 'isoformat'):
+            message[field] = ts.isoformat()
+        elif isinstance(ts, (int, float)):
+            message[field] = datetime.fromtimestamp(ts).isoformat()
+        elif field == 'timestamp':
+            message[field] = str(ts or '')
+    return message
+
+@app.route('/api/messages/stream', methods=['GET'])
+@login_required
+def stream_messages():
+    current_user = get_current_user()
+    user_id = current_user['id']
+
+    # EventSource resends the last id it saw when reconnecting
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    def generate():
+        # Subscribe only once the response is being consumed, so a stream that is never
+        # iterated (client gone before the first chunk) cannot leave a subscriber behind
+        subscriber = None
+        try:
+            subscriber, missed = message_bus.subscribe(user_id, last_event_id)
+            yield f"retry: {MESSAGES_STREAM_RETRY_MS}\n\n"
+            if missed is None:
+                # Too far behind to replay; the client reloads its conversation
+                yield sse_event('reset', {})
+            else:
+                for event in missed:
+                    yield sse_event(event['type'], event['data'], event['id'])
+            while not subscriber.overflowed:
+                event = subscriber.get(timeout=MESSAGES_STREAM_HEARTBEAT)
+                if event is None:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield sse_event(event['type'], event['data'], event['id'])
+            # Buffer overflowed: close so the client reconnects with Last-Event-ID and replays
+        finally:
+            if subscriber is not None:
+                message_bus.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/messages/<user_id>', methods=['GET'])
 @login_required
 def get_messages(user_id):
     current_user = get_current_user()
-    messages = []
-    
+
+    # limit: page size; before: load older history; since: only new messages (polling)
     try:
-        # Get messages between current user and target user
-        messages_ref = db.collection('messages').stream()
-        
-        for doc in messages_ref:
-            msg_data = doc.to_dict()
-            # Check if message is between current user and target user
-            if ((msg_data['sender_id'] == current_user['id'] and msg_data['receiver_id'] == user_id) or
-                (msg_data['sender_id'] == user_id and msg_data['receiver_id'] == current_user['id'])):
-                messages.append({**msg_data, 'id': doc.id})
-        
-        # Normalize timestamp to ISO strings and sort
-        norm_messages = []
-        for m in messages:
-            ts = m.get('timestamp')
-            if hasattr(ts, 'isoformat'):
-                m['timestamp'] = ts.isoformat()
-            elif isinstance(ts, (int, float)):
-                m['timestamp'] = datetime.fromtimestamp(ts).isoformat()
-            else:
-                m['timestamp'] = str(ts or '')
-            norm_messages.append(m)
+        limit = int(request.args.get('limit', MESSAGES_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = MESSAGES_PAGE_SIZE
+    limit = max(1, min(limit, MESSAGES_MAX_PAGE_SIZE))
+    before = parse_iso_param(request.args.get('before'))
+    since = parse_iso_param(request.args.get('since'))
+
+    try:
+        # Indexed query on the conversation key (composite index: conversation_id, timestamp)
+        query = db.collection('messages').where('conversation_id', '==', conversation_key(current_user['id'], user_id))
+        if since is not None:
+            query = query.where('timestamp', '>', since).order_by('timestamp').limit(limit)
+            docs = list(query.stream())
+        else:
+            if before is not None:
+                query = query.where('timestamp', '<', before)
+            query = query.order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit)
+            # Newest page first from Firestore, returned oldest-first for display
+            docs = list(query.stream())[::-1]
+
+        messages = [serialize_message(doc.id, doc.to_dict()) for doc in docs]
 
-        norm_messages.sort(key=lambda x: x.get('timestamp', ''))
-        messages = norm_messages
-        
     except Exception as e:
         print(f"Error fetching messages: {e}")
         # Return empty list if index error occurs
         return jsonify([])
-    
+
     return jsonify(messages)
 
 @app.route('/api/messages', methods=['POST'])
@@ -1223,9 +1981,12 @@ def send_message():
     current_user = get_current_user()
     data = request.get_json()
     
+    receiver_id = data.get('receiver_id')
+
     message_data = {
         'sender_id': current_user['id'],
-        'receiver_id': data.get('receiver_id'),
+        'receiver_id': receiver_id,
+        'conversation_id': conversation_key(current_user['id'], receiver_id),
         'message': data.get('message'),
         'timestamp': datetime.now(),
         'seen': False
@@ -1234,6 +1995,8 @@ def send_message():
     doc_ref = db.collection('messages').add(message_data)
     message_data['id'] = doc_ref[1].id
     message_data['timestamp'] = message_data['timestamp'].isoformat()
+
+    message_bus.publish('message', message_data, [message_data['sender_id'], receiver_id])
     
     return jsonify(message_data)
 
@@ -1261,6 +2024,8 @@ def update_message(message_id):
     }
     
     message_ref.update(update_data)
+    message_bus.publish('edited', serialize_message(message_id, {**message_data, **update_data}),
+                        [message_data['sender_id'], message_data.get('receiver_id')])
     return jsonify({'success': True, 'message': 'Message updated successfully'})
 
 @app.route('/api/messages/<message_id>', methods=['DELETE'])
@@ -1281,6 +2046,12 @@ def delete_message(message_id):
     
     # Delete message
     message_ref.delete()
+    message_bus.publish('deleted', {
+        'id': message_id,
+        'conversation_id': message_data.get('conversation_id'),
+        'sender_id': message_data['sender_id'],
+        'receiver_id': message_data.get('receiver_id')
+    }, [message_data['sender_id'], message_data.get('receiver_id')])
     return jsonify({'success': True, 'message': 'Message deleted successfully'})
 
 @app.route('/api/messages/<message_id>/read', methods=['PUT'])
@@ -1300,24 +2071,121 @@ def mark_message_read(message_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     # Mark message as seen (schema field: seen)
-    message_ref.update({'seen': True, 'read_at': datetime.now()})
+    read_data = {'seen': True, 'read_at': datetime.now()}
+    message_ref.update(read_data)
+    message_bus.publish('read', serialize_message(message_id, {**message_data, **read_data}),
+                        [message_data['sender_id'], message_data.get('receiver_id')])
     return jsonify({'success': True, 'message': 'Message marked as read'})
 
+# ==================== MAINTENANCE COMMANDS ====================
+
+# Firestore batches are limited to 500 writes
+MAINTENANCE_BATCH_SIZE = 500
+
+# Stream query and apply update_fn(doc) to each document in batched writes.
+# update_fn returns the fields to update, or None to leave the document alone.
+# Returns the number of documents updated.
+def batch_update_documents(query, update_fn):
+    batch = db.batch()
+    pending = 0
+    updated = 0
+    for doc in query.stream():
+        update_data = update_fn(doc)
+        if not update_data:
+            continue
+        batch.update(doc.reference, update_data)
+        pending += 1
+        updated += 1
+        if pending == MAINTENANCE_BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+    return updated
+
+# One-off backfill: `flask --app app backfill-conversations`
+@app.cli.command('backfill-conversations')
+def backfill_conversations():
+    """Add conversation_id to messages written before it existed."""
+    def update(doc):
+        msg_data = doc.to_dict()
+        if msg_data.get('conversation_id') or not msg_data.get('sender_id') or not msg_data.get('receiver_id'):
+            return None
+        return {'conversation_id': conversation_key(msg_data['sender_id'], msg_data['receiver_id'])}
+    updated = batch_update_documents(db.collection('messages'), update)
+    print(f"Backfilled conversation_id on {updated} messages")
+
+# One-off migration: `flask --app app migrate-drive-deadlines`
+@app.cli.command('migrate-drive-deadlines')
+def migrate_drive_deadlines():
+    """Convert string last_date_to_apply values to Firestore Timestamps."""
+    skipped = 0
+    def update(doc):
+        nonlocal skipped
+        raw = doc.to_dict().get('last_date_to_apply')
+        if not isinstance(raw, str):
+            return None
+        deadline = parse_deadline(raw)
+        if deadline is None:
+            skipped += 1
+            print(f"Skipping drive {doc.id}: unparseable deadline {raw!r}")
+            return None
+        return {'last_date_to_apply': deadline}
+    converted = batch_update_documents(db.collection('placement_drives'), update)
+    drive_catalog.invalidate()
+    print(f"Converted {converted} drive deadlines ({skipped} skipped)")
+
+# One-off backfill: `flask --app app backfill-student-search-fields`
+@app.cli.command('backfill-student-search-fields')
+def backfill_student_search_fields():
+    """Add skills_normalized and has_resume to existing student profiles."""
+    def update(doc):
+        student = doc.to_dict()
+        return student_search_fields(student.get('skills', []), student.get('resume_url'))
+    updated = batch_update_documents(db.collection('users').where('user_type', '==', 'student'), update)
+    print(f"Backfilled search fields on {updated} students")
+
+# One-off backfill: `flask --app app backfill-contact-names`
+@app.cli.command('backfill-contact-names')
+def backfill_contact_names():
+    """Add name_lower (used by contact search) to existing user profiles."""
+    def update(doc):
+        return {'name_lower': name_search_key((doc.to_dict() or {}).get('name'))}
+    updated = batch_update_documents(db.collection('users').select(['name']), update)
+    print(f"Backfilled contact names on {updated} users")
+
+# One-off migration: `flask --app app migrate-study-tasks`
+@app.cli.command('migrate-study-tasks')
+def migrate_study_tasks():
+    """Move study plan task arrays into study_plans/{id}/tasks documents."""
+    plans = 0
+    moved = 0
+    for plan_doc in db.collection('study_plans').stream():
+        plan_data = plan_doc.to_dict()
+        if 'tasks' in plan_data:
+            moved += migrate_plan_tasks(plan_doc.reference, plan_data)
+            plans += 1
+    print(f"Moved {moved} tasks from {plans} study plans")
+
 # ==================== LEGACY ROUTES (for backward compatibility) ====================
 
 @app.route('/askai', methods=['POST'])
+@rate_limited('legacy')
 def chatbot_api_legacy():
     data = request.get_json()
     prompt = data.get('prompt', '')
     return jsonify({'response': ask_chatbot(prompt)})
 
 @app.route('/summarize', methods=['POST'])
+@rate_limited('legacy')
 def summarize_api_legacy():
     data = request.get_json()
     text = data.get('text', '')
     return jsonify({'summary': summarize_notes(text)})
 
 @app.route('/quiz', methods=['POST'])
+@rate_limited('legacy')
 def quiz_api_legacy():
     data = request.get_json()
     text = data.get('text', '')
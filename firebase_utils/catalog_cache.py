@@ -0,0 +1,72 @@
+import threading
+import time
+
+from firebase_admin import firestore
+
+# Read-through, write-invalidated cache for small, read-heavy collections
+# (e.g. the open placement drives list).
+# Writers call invalidate(), which clears the local copy and bumps a version counter
+# in a Firestore document. Other worker processes compare that single small document
+# against the version they loaded with (at most every check_interval seconds), so they
+# notice a change without re-reading the whole collection.
+
+
+class CatalogCache:
+    def __init__(self, db, name, loader, ttl=300, check_interval=5):
+        self.db = db
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._items = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    def _version_ref(self):
+        return self.db.collection("cache_versions").document(self.name)
+
+    def _read_version(self):
+        snap = self._version_ref().get()
+        return (snap.to_dict() or {}).get("version", 0) if snap.exists else 0
+
+    # Return a copy of the cached items, reloading when expired or stale
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._items is not None and now - self._loaded_at < self.ttl:
+                if now - self._checked_at < self.check_interval:
+                    return [dict(item) for item in self._items]
+                self._checked_at = now
+                try:
+                    if self._read_version() == self._version:
+                        return [dict(item) for item in self._items]
+                except Exception as e:
+                    print(f"Error checking {self.name} cache version: {e}")
+                    return [dict(item) for item in self._items]
+
+            # Read the version before loading so a concurrent write is never missed
+            try:
+                version = self._read_version()
+            except Exception as e:
+                print(f"Error reading {self.name} cache version: {e}")
+                version = None
+            items = self.loader()
+            self._items = items
+            self._version = version
+            self._loaded_at = self._checked_at = time.monotonic()
+            return [dict(item) for item in items]
+
+    # Drop the local copy and signal other processes that the data changed
+    def invalidate(self):
+        with self._lock:
+            self._items = None
+        try:
+            self._version_ref().set({"version": firestore.Increment(1)}, merge=True)
+        except Exception as e:
+            print(f"Error bumping {self.name} cache version: {e}")
+
+    def version(self):
+        with self._lock:
+            return self._version
@@ -0,0 +1,239 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+from datetime import datetime, timezone
+
+from .firestore_utils import normalize_skills
+
+# In-memory inverted index matching students to placement drives.
+# Students are indexed by skill, by department and in a CGPA-sorted array, so
+# "eligible students for a drive" is a few set intersections instead of a scan.
+# Open drives are indexed by department the same way for the student-side lookup.
+# Writers call upsert_*/remove_* to keep the index current; a full rebuild from
+# Firestore runs lazily on first use and again after ttl seconds, which also picks up
+# changes made by other worker processes.
+
+ANY_DEPARTMENT = "*"  # drives with no department restriction
+
+
+def _department_key(department):
+    return str(department or "").strip().lower()
+
+
+def _min_cgpa(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+class EligibilityIndex:
+    def __init__(self, load_students, load_drives, ttl=600):
+        self.load_students = load_students
+        self.load_drives = load_drives
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._reset()
+
+    def _reset(self):
+        self._students = {}       # id -> {name, email, department, cgpa, skills}
+        self._by_skill = {}       # skill -> set of student ids
+        self._by_department = {}  # department -> set of student ids
+        self._by_cgpa = []        # sorted (cgpa, id)
+        self._drives = {}         # id -> {company_name, job_role, min_cgpa, departments, skills, deadline}
+        self._drives_by_department = {}  # department (or ANY_DEPARTMENT) -> set of drive ids
+
+    # ---------- loading ----------
+
+    def _ensure_loaded(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        students = self.load_students()
+        drives = self.load_drives()
+        self._reset()
+        for student_id, data in students:
+            self._add_student(student_id, data)
+        for drive_id, data in drives:
+            self._add_drive(drive_id, data)
+        self._loaded_at = time.monotonic()
+
+    # Force a rebuild on next use
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    # ---------- students ----------
+
+    def _add_student(self, student_id, data):
+        entry = {
+            "name": data.get("name"),
+            "email": data.get("email"),
+            "department": data.get("department"),
+            "cgpa": _min_cgpa(data.get("cgpa")) or 0.0,
+            "skills": set(data.get("skills_normalized") or normalize_skills(data.get("skills"))),
+        }
+        self._students[student_id] = entry
+        for skill in entry["skills"]:
+            self._by_skill.setdefault(skill, set()).add(student_id)
+        self._by_department.setdefault(_department_key(entry["department"]), set()).add(student_id)
+        insort(self._by_cgpa, (entry["cgpa"], student_id))
+
+    def _drop_student(self, student_id):
+        entry = self._students.pop(student_id, None)
+        if entry is None:
+            return
+        for skill in entry["skills"]:
+            ids = self._by_skill.get(skill)
+            if ids is not None:
+                ids.discard(student_id)
+                if not ids:
+                    del self._by_skill[skill]
+        department = _department_key(entry["department"])
+        ids = self._by_department.get(department)
+        if ids is not None:
+            ids.discard(student_id)
+            if not ids:
+                del self._by_department[department]
+        pos = bisect_left(self._by_cgpa, (entry["cgpa"], student_id))
+        if pos < len(self._by_cgpa) and self._by_cgpa[pos] == (entry["cgpa"], student_id):
+            del self._by_cgpa[pos]
+
+    # Add or replace a student profile (no-op until the index is first loaded)
+    def upsert_student(self, student_id, data):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            self._drop_student(student_id)
+            if data.get("user_type", "student") == "student":
+                self._add_student(student_id, data)
+
+    def remove_student(self, student_id):
+        with self._lock:
+            self._drop_student(student_id)
+
+    # ---------- drives ----------
+
+    def _add_drive(self, drive_id, data):
+        departments = {_department_key(d) for d in (data.get("departments") or []) if _department_key(d)}
+        entry = {
+            "company_name": data.get("company_name"),
+            "job_role": data.get("job_role"),
+            "min_cgpa": _min_cgpa(data.get("min_cgpa")),
+            "departments": departments,
+            "skills": set(normalize_skills(data.get("requirements") or [])),
+            "deadline": data.get("deadline"),
+        }
+        self._drives[drive_id] = entry
+        for department in departments or (ANY_DEPARTMENT,):
+            self._drives_by_department.setdefault(department, set()).add(drive_id)
+
+    def _drop_drive(self, drive_id):
+        entry = self._drives.pop(drive_id, None)
+        if entry is None:
+            return
+        for department in entry["departments"] or (ANY_DEPARTMENT,):
+            ids = self._drives_by_department.get(department)
+            if ids is not None:
+                ids.discard(drive_id)
+                if not ids:
+                    del self._drives_by_department[department]
+
+    # Add or replace a drive; expects the aliased shape (min_cgpa, departments, requirements, deadline)
+    def upsert_drive(self, drive_id, data):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            self._drop_drive(drive_id)
+            self._add_drive(drive_id, data)
+
+    def remove_drive(self, drive_id):
+        with self._lock:
+            self._drop_drive(drive_id)
+
+    # ---------- queries ----------
+
+    # Eligible students for a drive, ranked by skill overlap then CGPA.
+    # Returns None if the drive is not open (or unknown).
+    def eligible_students(self, drive_id, limit=None, min_overlap=0):
+        with self._lock:
+            self._ensure_loaded()
+            drive = self._drives.get(drive_id)
+            if drive is None:
+                return None
+
+            # CGPA floor: everything right of the bisection point qualifies
+            start = bisect_left(self._by_cgpa, (drive["min_cgpa"], "")) if drive["min_cgpa"] is not None else 0
+            candidates = {student_id for _, student_id in self._by_cgpa[start:]}
+            if drive["departments"]:
+                in_department = set()
+                for department in drive["departments"]:
+                    in_department |= self._by_department.get(department, set())
+                candidates &= in_department
+
+            overlap = Counter()
+            for skill in drive["skills"]:
+                for student_id in self._by_skill.get(skill, ()):
+                    if student_id in candidates:
+                        overlap[student_id] += 1
+
+            results = []
+            for student_id in candidates:
+                if overlap[student_id] < min_overlap:
+                    continue
+                student = self._students[student_id]
+                results.append({
+                    "id": student_id,
+                    "name": student["name"],
+                    "email": student["email"],
+                    "department": student["department"],
+                    "cgpa": student["cgpa"],
+                    "skill_overlap": overlap[student_id],
+                    "matched_skills": sorted(student["skills"] & drive["skills"]),
+                })
+        results.sort(key=lambda r: (-r["skill_overlap"], -r["cgpa"], r["name"] or ""))
+        return results[:limit] if limit else results
+
+    # Open drives a student qualifies for, ranked by skill overlap then deadline.
+    # Returns None if the student is not in the index.
+    def eligible_drives(self, student_id, limit=None):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            self._ensure_loaded()
+            student = self._students.get(student_id)
+            if student is None:
+                return None
+
+            candidates = set(self._drives_by_department.get(ANY_DEPARTMENT, ()))
+            candidates |= self._drives_by_department.get(_department_key(student["department"]), set())
+
+            results = []
+            for drive_id in candidates:
+                drive = self._drives[drive_id]
+                if drive["min_cgpa"] is not None and student["cgpa"] < drive["min_cgpa"]:
+                    continue
+                if drive["deadline"] is not None and drive["deadline"] <= now:
+                    continue
+                matched = student["skills"] & drive["skills"]
+                results.append({
+                    "id": drive_id,
+                    "company_name": drive["company_name"],
+                    "job_role": drive["job_role"],
+                    "deadline": drive["deadline"],
+                    "skill_overlap": len(matched),
+                    "skills_required": len(drive["skills"]),
+                    "matched_skills": sorted(matched),
+                })
+        far_future = datetime.max.replace(tzinfo=timezone.utc)
+        results.sort(key=lambda r: (-r["skill_overlap"], r["deadline"] or far_future))
+        return results[:limit] if limit else results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "students": len(self._students),
+                "drives": len(self._drives),
+                "skills": len(self._by_skill),
+                "loaded": self._loaded_at is not None,
+            }
@@ -1,15 +1,39 @@
 from .firebase_config import db
 
+# Normalized (lowercase, de-duplicated) skills array used for array_contains_any search
+def normalize_skills(skills):
+    if isinstance(skills, str):
+        skills = skills.split(",")
+    normalized = []
+    for skill in skills or []:
+        skill = str(skill).strip().lower()
+        if skill and skill not in normalized:
+            normalized.append(skill)
+    return normalized
+
+# Lowercased name used for case-insensitive prefix search on contacts
+def name_search_key(name):
+    return " ".join(str(name or "").lower().split())
+
+# Derived fields that let officers search students server-side
+def student_search_fields(skills, resume_url):
+    return {
+        "skills_normalized": normalize_skills(skills),
+        "has_resume": bool(resume_url)
+    }
+
 # Add a student user
 def add_student(uid, name, email, department, cgpa, skills, resume_url):
     db.collection("users").document(uid).set({
         "name": name,
+        "name_lower": name_search_key(name),
         "email": email,
         "user_type": "student",
         "department": department,
         "cgpa": cgpa,
         "skills": skills,
-        "resume_url": resume_url
+        "resume_url": resume_url,
+        **student_search_fields(skills, resume_url)
     }, merge=True)
     return True
 
@@ -17,6 +41,7 @@ def add_student(uid, name, email, department, cgpa, skills, resume_url):
 def add_officer(uid, name, email):
     db.collection("users").document(uid).set({
         "name": name,
+        "name_lower": name_search_key(name),
         "email": email,
         "user_type": "placement_officer"
     }, merge=True)
@@ -30,6 +55,7 @@ def get_user(uid):
 # Update student resume
 def update_resume(uid, resume_url):
     db.collection("users").document(uid).update({
-        "resume_url": resume_url
+        "resume_url": resume_url,
+        "has_resume": bool(resume_url)
     })
     return True
@@ -0,0 +1,87 @@
+import queue
+import threading
+from collections import deque
+
+# In-process pub/sub for chat events (new/edited/deleted/read).
+# send_message and friends publish here; the SSE stream endpoint subscribes.
+# Each process keeps its own bus, so every worker only pushes the events it handled itself.
+
+HISTORY_SIZE = 1000
+SUBSCRIBER_BUFFER_SIZE = 100
+
+
+class Subscriber:
+    def __init__(self, user_id, buffer_size):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=buffer_size)
+        # Set when the client falls behind; the stream closes and the client
+        # reconnects with Last-Event-ID to replay from history
+        self.overflowed = False
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class MessageBus:
+    def __init__(self, history_size=HISTORY_SIZE, buffer_size=SUBSCRIBER_BUFFER_SIZE):
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._history = deque(maxlen=history_size)
+        self._subscribers = {}
+        self.buffer_size = buffer_size
+
+    # Publish an event to every connected participant
+    def publish(self, event_type, data, recipients):
+        with self._lock:
+            self._last_id += 1
+            event = {
+                'id': self._last_id,
+                'type': event_type,
+                'data': data,
+                'recipients': set(r for r in recipients if r)
+            }
+            self._history.append(event)
+            for user_id in event['recipients']:
+                for subscriber in self._subscribers.get(user_id, ()):
+                    subscriber.push(event)
+        return event['id']
+
+    # Register a connection; returns the subscriber and any events missed since last_event_id.
+    # missed is None when last_event_id is older than the retained history
+    # (or from before a restart), in which case the client should reload.
+    def subscribe(self, user_id, last_event_id=None):
+        subscriber = Subscriber(user_id, self.buffer_size)
+        missed = []
+        with self._lock:
+            if last_event_id is not None:
+                oldest = self._history[0]['id'] if self._history else None
+                if last_event_id > self._last_id or (oldest is not None and last_event_id < oldest - 1):
+                    missed = None
+                else:
+                    missed = [e for e in self._history if e['id'] > last_event_id and user_id in e['recipients']]
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber, missed
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.user_id]
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+
+message_bus = MessageBus()
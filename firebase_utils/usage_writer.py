@@ -0,0 +1,141 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Background writer for AI usage telemetry.
+# Records are queued on the request path and committed in Firestore WriteBatches
+# (up to 500 writes each) by a daemon thread, so telemetry adds no request latency.
+
+load_dotenv()
+
+MAX_BATCH_SIZE = 500  # Firestore's limit on writes per batch
+QUEUE_SIZE = int(os.getenv("AI_USAGE_QUEUE_SIZE", "10000"))
+FLUSH_INTERVAL_MS = int(os.getenv("AI_USAGE_FLUSH_MS", "1000"))
+# JSON-lines file for records that could not be queued or written; unset drops them
+SPILL_FILE = os.getenv("AI_USAGE_SPILL_FILE", "")
+SHUTDOWN_TIMEOUT = 10
+
+
+def _encode(record):
+    return json.dumps({k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in record.items()})
+
+
+def _decode(line):
+    record = json.loads(line)
+    if isinstance(record.get("timestamp"), str):
+        try:
+            record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+        except ValueError:
+            pass
+    return record
+
+
+class UsageWriter:
+    def __init__(self, db, collection="ai_usage", queue_size=QUEUE_SIZE,
+                 flush_interval_ms=FLUSH_INTERVAL_MS, spill_file=SPILL_FILE):
+        self.db = db
+        self.collection = collection
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.spill_file = spill_file
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._spill_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"written": 0, "batches": 0, "dropped": 0, "spilled": 0, "failed_batches": 0}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._replay_spill()
+        self._thread = threading.Thread(target=self._run, name="ai-usage-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # Queue a record; never blocks the caller
+    def add(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._overflow([record])
+
+    # Drain whatever is still queued, then stop the writer thread (also runs at exit)
+    def close(self, timeout=SHUTDOWN_TIMEOUT):
+        if self._thread is None or self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            return {**self._stats, "queued": self._queue.qsize()}
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            # Collect until the batch is full or the flush interval elapses
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < MAX_BATCH_SIZE:
+                remaining = 0 if self._stop.is_set() else deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, records):
+        try:
+            batch = self.db.batch()
+            collection = self.db.collection(self.collection)
+            for record in records:
+                batch.set(collection.document(), record)
+            batch.commit()
+            self._count("written", len(records))
+            self._count("batches")
+        except Exception as e:
+            print(f"Error writing AI usage batch ({len(records)} records): {e}")
+            self._count("failed_batches")
+            self._overflow(records)
+
+    # Spill records to the local file if configured, otherwise drop them
+    def _overflow(self, records):
+        if self.spill_file:
+            try:
+                with self._spill_lock, open(self.spill_file, "a", encoding="utf-8") as f:
+                    for record in records:
+                        f.write(_encode(record) + "\n")
+                self._count("spilled", len(records))
+                return
+            except Exception as e:
+                print(f"Error spilling AI usage records: {e}")
+        self._count("dropped", len(records))
+
+    # Re-queue records spilled by a previous run
+    def _replay_spill(self):
+        if not self.spill_file or not os.path.exists(self.spill_file):
+            return
+        try:
+            with self._spill_lock:
+                with open(self.spill_file, encoding="utf-8") as f:
+                    lines = [line for line in f if line.strip()]
+                os.remove(self.spill_file)
+        except Exception as e:
+            print(f"Error reading AI usage spill file: {e}")
+            return
+        for line in lines:
+            try:
+                self.add(_decode(line))
+            except ValueError:
+                continue
@@ -0,0 +1,57 @@
+import time
+
+from ai_modules.job_queue import JobQueue, DONE, FAILED, RUNNING
+
+
+def _insert(queue, job_id, status=RUNNING, worker="old-process", lease_until=None, attempts=1):
+    with queue._db_lock:
+        queue._db.execute(
+            "INSERT INTO jobs (id, kind, owner, status, payload, result, error, created_at, finished_at, "
+            "worker, lease_until, attempts) VALUES (?, 'double', 'u', ?, '21', 'null', NULL, ?, NULL, ?, ?, ?)",
+            (job_id, status, time.time(), worker, lease_until, attempts),
+        )
+        queue._db.commit()
+
+
+def _queue(path, **kwargs):
+    queue = JobQueue(max_workers=2, db_path=str(path), **kwargs)
+    queue.register("double", lambda payload: payload * 2)
+    return queue
+
+
+def _wait(queue, job_id, timeout=2):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job and job["status"] in (DONE, FAILED):
+            return job
+        time.sleep(0.01)
+    return queue.get(job_id)
+
+
+def test_recovers_lapsed_jobs_whatever_their_worker(tmp_path):
+    queue = _queue(tmp_path / "jobs.db")
+    # Legacy row without a lease, and a row whose lease lapsed (e.g. same PID after a container restart)
+    _insert(queue, "legacy", lease_until=None)
+    _insert(queue, "lapsed", worker="host:1", lease_until=time.time() - 1)
+    assert queue.recover() == 2
+    assert _wait(queue, "legacy")["result"] == 42
+    assert _wait(queue, "lapsed")["result"] == 42
+
+
+def test_live_lease_is_not_stolen_and_claim_is_exclusive(tmp_path):
+    first = _queue(tmp_path / "jobs.db")
+    second = _queue(tmp_path / "jobs.db")
+    _insert(first, "live", worker="other", lease_until=time.time() + 60)
+    _insert(first, "lapsed", lease_until=time.time() - 1)
+    assert first.recover() + second.recover() == 1
+    assert first.get("live")["status"] == RUNNING
+
+
+def test_job_failing_repeatedly_is_abandoned(tmp_path):
+    queue = _queue(tmp_path / "jobs.db", max_attempts=3)
+    _insert(queue, "poison", lease_until=time.time() - 1, attempts=3)
+    assert queue.recover() == 0
+    job = queue.get("poison")
+    assert job["status"] == FAILED
+    assert job["finished_at"] is not None
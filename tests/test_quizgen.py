@@ -0,0 +1,71 @@
+import pytest
+
+from ai_modules.gemini_config import extract_json
+from ai_modules.quizgen import validate_question
+
+
+def _question(**overrides):
+    item = {"question": "What is 2 + 2?", "options": ["3", "4", "5", "6"], "answer": 1, "explanation": "Basic sum."}
+    item.update(overrides)
+    return item
+
+
+def test_valid_multiple_choice():
+    assert validate_question(_question()) == {
+        "question": "What is 2 + 2?", "options": ["3", "4", "5", "6"], "answer": 1, "explanation": "Basic sum.",
+    }
+
+
+@pytest.mark.parametrize("answer, expected", [("B", 1), ("b", 1), ("4", 1), ("1", 1)])
+def test_answer_letter_text_or_digit_is_normalized(answer, expected):
+    assert validate_question(_question(answer=answer))["answer"] == expected
+
+
+@pytest.mark.parametrize("overrides", [
+    {"options": ["3", "4", "5"]},            # multiple choice needs exactly 4 options
+    {"options": ["3", "4", "5", "6", "7"]},
+    {"options": ["3", "4", "4", "6"]},       # duplicate option
+    {"options": ["3", "", "5", "6"]},        # empty option
+    {"answer": 4},                           # out of range
+    {"answer": True},
+    {"answer": None},
+    {"question": "  "},
+    {"options": "3, 4, 5, 6"},
+])
+def test_invalid_multiple_choice(overrides):
+    assert validate_question(_question(**overrides)) is None
+
+
+def test_not_a_dict():
+    assert validate_question(["What is 2 + 2?"]) is None
+
+
+def test_true_false():
+    item = {"question": "The sky is green.", "options": ["True", "False"], "answer": 1}
+    assert validate_question(item, "true-false")["answer"] == 1
+    assert validate_question({**item, "options": ["Yes", "No"]}, "true-false") is None
+
+
+def test_fill_blank_requires_blank():
+    item = _question(question="2 + 2 = ____")
+    assert validate_question(item, "fill-blank") is not None
+    assert validate_question(_question(), "fill-blank") is None
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('[1, 2]', [1, 2]),
+    ('```json\n{"a": 1}\n```', {"a": 1}),
+    ('```\n{"a": 1}\n```', {"a": 1}),
+    ('Here is the quiz:\n```json\n{"a": [1, 2]}\n```\nGood luck!', {"a": [1, 2]}),
+    ('Sure! {"tasks": [{"task": "Read"}]} Let me know if you need more.', {"tasks": [{"task": "Read"}]}),
+    ('Note [draft]: {"a": 1}', {"a": 1}),
+])
+def test_extract_json(raw, expected):
+    assert extract_json(raw) == expected
+
+
+@pytest.mark.parametrize("raw", ["", None, "no json here", '{"a": '])
+def test_extract_json_without_json(raw):
+    with pytest.raises(ValueError):
+        extract_json(raw)
@@ -0,0 +1,47 @@
+from ai_modules.rate_limit import MemoryBackend, SlidingWindowLimiter, parse_budgets
+
+
+def _limiter(budgets):
+    return SlidingWindowLimiter(budgets=budgets, backend=MemoryBackend())
+
+
+def test_budget_is_enforced_within_window(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("ai_modules.rate_limit.time.time", lambda: clock[0])
+    limiter = _limiter({"quizgen": (2, 60)})
+    assert limiter.check("quizgen", "user:a").allowed
+    assert limiter.check("quizgen", "user:a").allowed
+    result = limiter.check("quizgen", "user:a")
+    assert not result.allowed
+    assert result.headers()["Retry-After"] == "60"
+    clock[0] += 61
+    assert limiter.check("quizgen", "user:a").allowed
+
+
+def test_short_window_sweep_keeps_long_window_log(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("ai_modules.rate_limit.time.time", lambda: clock[0])
+    limiter = _limiter({"quizgen": (2, 3600), "chatbot": (30, 1)})
+    assert limiter.check("quizgen", "user:a").allowed
+    assert limiter.check("quizgen", "user:a").allowed
+    # Traffic to a tool with a 1 s window triggers a sweep; quizgen's hour-long log must survive it
+    clock[0] += 2
+    assert limiter.check("chatbot", "user:a").allowed
+    assert not limiter.check("quizgen", "user:a").allowed
+
+
+def test_sweep_drops_idle_identities(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("ai_modules.rate_limit.time.time", lambda: clock[0])
+    backend = MemoryBackend()
+    limiter = SlidingWindowLimiter(budgets={"chatbot": (30, 1)}, backend=backend)
+    limiter.check("chatbot", "user:a")
+    clock[0] += 5
+    limiter.check("chatbot", "user:b")
+    assert list(backend._hits) == ["chatbot:user:b"]
+
+
+def test_parse_budgets_overrides_and_ignores_invalid():
+    budgets = parse_budgets("chatbot=5/10, bogus, quizgen=x/60")
+    assert budgets["chatbot"] == (5, 10.0)
+    assert budgets["quizgen"] == (10, 60)
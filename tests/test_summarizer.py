@@ -0,0 +1,46 @@
+import random
+
+from ai_modules.chat_memory import estimate_tokens
+from ai_modules.summarizer import split_notes
+
+
+def _notes(seed=1, paragraphs=300):
+    rng = random.Random(seed)
+    words = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu".split()
+    blocks = []
+    for i in range(paragraphs):
+        if i % 7 == 0:
+            blocks.append(f"## Topic {i}")
+        else:
+            blocks.append(" ".join(rng.choice(words) for _ in range(rng.randint(40, 200))) + ".")
+    return blocks
+
+
+def test_chunks_respect_budget():
+    chunks = split_notes("\n\n".join(_notes()), max_tokens=3000)
+    assert len(chunks) > 12
+    assert all(estimate_tokens(chunk) <= 3000 for chunk in chunks)
+
+
+def test_inserting_text_keeps_other_chunks():
+    blocks = _notes()
+    before = split_notes("\n\n".join(blocks), max_tokens=3000)
+    edited = blocks[:3] + ["A new paragraph inserted near the start of the notes."] + blocks[3:]
+    after = split_notes("\n\n".join(edited), max_tokens=3000)
+    # Only the chunk that received the new paragraph changes; the rest keep their text (and hash)
+    assert len(set(before) - set(after)) <= 1
+    assert len(set(after) - set(before)) <= 2
+
+
+def test_editing_a_paragraph_keeps_other_chunks():
+    blocks = _notes()
+    before = split_notes("\n\n".join(blocks), max_tokens=3000)
+    blocks[100] = blocks[100] + " One more sentence."
+    after = split_notes("\n\n".join(blocks), max_tokens=3000)
+    assert len(set(before) - set(after)) <= 2
+
+
+def test_oversized_paragraph_is_split():
+    chunks = split_notes("word. " * 5000, max_tokens=500)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 500 for chunk in chunks)